@@ -0,0 +1,89 @@
+"""
+Micro-benchmark of redact.py: the line-by-line generator (Redactor.get_sensitive_data)
+against the single-pass SensitiveDataMatcher, and finding the redaction areas with one
+page.search_for per hit against the page word index (redaction_areas).
+
+    python -m bench_redaction "PAPI Feedback.pdf" "Assessment Notes.pdf" --name "Marc van Kampen" --pages 60
+
+The page texts are extracted once, then repeated up to --pages pages per file, so short
+sample PDFs stand in for 30-60 page reports. Only matching is timed, not fitz.
+Finding the redaction areas is timed on the real pages, text extraction included.
+"""
+import argparse
+import sys
+import time
+import fitz
+from redact import Redactor, SensitiveDataMatcher, redaction_areas
+
+def page_texts(path, pages):
+    with fitz.open(path) as doc:
+        texts = [page.get_text("text") for page in doc]
+    return [texts[i % len(texts)] for i in range(max(pages, len(texts)))] if texts else []
+
+def time_per_page(match_page, texts, repeat):
+    """Best of `repeat` runs over all pages, in milliseconds per page."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            match_page(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(texts) * 1000
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bench_redaction', description="Compare the redaction matchers.")
+    parser.add_argument('pdfs', nargs='+', help="PDF files to take the page texts from")
+    parser.add_argument('--name', required=True, help="Applicant full name")
+    parser.add_argument('--pages', type=int, default=60, help="Pages per file")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per matcher (best is reported)")
+    args = parser.parse_args(argv)
+
+    name_parts = args.name.split()
+    target_names = [name_parts[0], name_parts[-1]]  # As in redact_folder
+
+    def generator(text):
+        # As Redactor.redaction did: compile per page, deduplicate nothing
+        return list(Redactor.get_sensitive_data(text.split('\n'), target_names))
+
+    def matcher(text):
+        # Built per page here too, to include compiling; redact_folder builds it once per applicant
+        return SensitiveDataMatcher(target_names).find(text)
+
+    shared = SensitiveDataMatcher(target_names)
+    print(f"{'file':30} {'pages':>5} {'generator':>10} {'matcher':>10} {'shared':>10} {'searches':>11}")
+    for path in args.pdfs:
+        texts = page_texts(path, args.pages)
+        if not texts:
+            print(f"{path}: no pages")
+            continue
+        # Every hit costs a page.search_for in Redactor.redaction
+        old_hits = sum(len(generator(text)) for text in texts)
+        new_hits = sum(len(shared.find(text)) for text in texts)
+        timings = [time_per_page(match_page, texts, args.repeat) for match_page in (generator, matcher, shared.find)]
+        print(f"{path[-30:]:30} {len(texts):5} " + " ".join(f"{ms:8.3f}ms" for ms in timings) +
+              f" {old_hits:5}/{new_hits:<5}")
+    print("\nms per page (best run); searches = page.search_for calls, generator/matcher")
+
+    def before(page):
+        # Redactor.redaction before: the text, then one search (text extraction) per hit
+        for hit in generator(page.get_text("text")):
+            page.search_for(hit)
+
+    def after(page):
+        # Redactor.redaction now: one text page shared by the matcher, the word index and searches
+        textpage = page.get_textpage()
+        text = page.get_text("text", textpage=textpage)
+        redaction_areas(page, text, shared.find(text), textpage)
+
+    print(f"\n{'file':30} {'pages':>5} {'before':>10} {'after':>10}")
+    for path in args.pdfs:
+        with fitz.open(path) as doc:
+            pages = list(doc)
+            timings = [time_per_page(find_areas, pages, args.repeat) for find_areas in (before, after)]
+            print(f"{path[-30:]:30} {len(pages):5} " + " ".join(f"{ms:8.2f}ms" for ms in timings))
+    print("\nms per page (best run) to find the text, the hits and their redaction areas")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,36 @@
+import threading
+
+class JobCancelled(Exception):
+    """Raised inside the pipeline once its cancel token has fired."""
+
+class CancelToken:
+    """
+    Cooperative cancellation shared by redaction, prompting and rendering of one job.
+    Long-running steps call raise_if_cancelled() between units of work and use wait()
+    instead of time.sleep(), so a cancel takes effect within one step.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = None
+
+    def cancel(self, reason="Cancelled by user"):
+        self.reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise JobCancelled(self.reason)
+
+    def wait(self, seconds):
+        """Sleeps up to `seconds`; returns True if cancelled in the meantime."""
+        return self._event.wait(seconds)
+
+def check_cancelled(cancel_token):
+    """raise_if_cancelled() for optional tokens."""
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
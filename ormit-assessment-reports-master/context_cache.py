@@ -0,0 +1,78 @@
+import hashlib
+
+def context_block(context):
+    """The file section appended after each prompt's instructions."""
+    return f"Use the following files to complete the tasks. Do not give any output for this prompt.\n{context}"
+
+def context_hash(context):
+    """Returns a stable hash of the context text."""
+    return hashlib.sha256(context.encode('utf-8')).hexdigest()
+
+class ProviderContextCache:
+    """Registers the context with the backend's own caching (Gemini cached content), so prompts only send their instructions."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def create(self, context):
+        return self.backend.create_cached_context(context_block(context))
+
+    def generate(self, handle, prompt_text, **kwargs):
+        return self.backend.generate(prompt_text, cached_context=handle, **kwargs)
+
+    def delete(self, handle):
+        self.backend.delete_cached_context(handle)
+
+class LocalContextCache:
+    """
+    In-process stand-in for provider-side caching, used for tests and offline runs.
+    The context is stored once under its hash and prepended to each prompt at call time.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._entries = {}
+
+    def create(self, context):
+        handle = context_hash(context)
+        self._entries[handle] = context
+        return handle
+
+    def generate(self, handle, prompt_text, **kwargs):
+        return self.backend.generate(f"{prompt_text}\n\n{context_block(self._entries[handle])}", **kwargs)
+
+    def delete(self, handle):
+        self._entries.pop(handle, None)
+
+class SharedContext:
+    """
+    A file context of one run, assembled once and registered with a cache backend.
+    Falls back to sending the full context with every prompt when caching is unavailable
+    (no cache, context below the provider's minimum size, unsupported backend, ...).
+    """
+
+    def __init__(self, backend, context, cache=None):
+        self.backend = backend
+        self.context = context
+        self.cache = cache
+        self.handle = None
+        if cache is not None:
+            try:
+                self.handle = cache.create(context)
+                print(f"Context cached as {self.handle}")
+            except Exception as e:
+                print(f"Context caching unavailable, sending full context with each prompt: {e}")
+
+    def generate(self, prompt_text, **kwargs):
+        """Returns the response text, or an iterator of text chunks with stream=True."""
+        if self.handle is not None:
+            return self.cache.generate(self.handle, prompt_text, **kwargs)
+        return self.backend.generate(f"{prompt_text}\n\n{context_block(self.context)}", **kwargs)
+
+    def close(self):
+        if self.handle is not None:
+            try:
+                self.cache.delete(self.handle)
+            except Exception as e:
+                print(f"Error deleting cached context {self.handle}: {e}")
+            self.handle = None
@@ -0,0 +1,104 @@
+import re
+import fitz
+
+# Outputs of an extractor are only used when its confidence (0-1) reaches this value;
+# otherwise the prompt is sent to the model as before
+min_confidence = 1.0
+
+# --- Cognitive test (Logiks General report) ---
+
+# Chart labels in the order of prompt4_cogcap_scores: general ability, speed, accuracy, verbal, numerical, abstract
+COGTEST_LABELS = ['total score', 'speed', 'accuracy', 'verbal', 'numerical', 'abstract']
+COGTEST_SCORE_REG = re.compile(r'^(\d{1,3}) \((\d{1,2})\)$')  # Percentile (sten), e.g. "76 (7)"
+max_label_gap = 40  # Points between a chart label and its score bar below it
+
+# Upper percentile of sten 1 to 9 (the standard normal sten bands)
+STEN_BOUNDARIES = [2.3, 6.7, 15.9, 30.9, 50.0, 69.1, 84.1, 93.3, 97.7]
+
+def _page_lines(page):
+    """Returns (y0, text) for every text line of the page, built from its word boxes."""
+    lines = {}
+    for x0, y0, x1, y1, word, block_no, line_no, word_no in page.get_text("words"):
+        line = lines.setdefault((block_no, line_no), [y0, []])
+        line[0] = min(line[0], y0)
+        line[1].append(word)
+    return [(y0, " ".join(words)) for y0, words in lines.values()]
+
+def expected_sten(percentile):
+    return 1 + sum(percentile > boundary for boundary in STEN_BOUNDARIES)
+
+def extract_cogtest_scores(pdf_path):
+    """
+    Reads the six percentile scores from the charts of the cognitive test report.
+    Every chart label is matched to the first "percentile (sten)" line below it on the
+    same page. Returns (scores, confidence): scores is None unless all six were found,
+    and each score whose sten does not match its percentile lowers the confidence.
+    """
+    found = {}
+    try:
+        with fitz.open(pdf_path) as doc:
+            for page in doc:
+                lines = sorted(_page_lines(page))
+                labels = [(y0, text.lower()) for y0, text in lines if text.lower() in COGTEST_LABELS]
+                for y0, text in lines:
+                    match = COGTEST_SCORE_REG.match(text)
+                    if not match:
+                        continue
+                    above = [label for label in labels if 0 <= y0 - label[0] <= max_label_gap]
+                    if above:
+                        label = max(above)[1]  # Closest label above the score
+                        found.setdefault(label, (int(match.group(1)), int(match.group(2))))
+    except Exception as e:
+        print(f"Error reading cognitive test {pdf_path}: {e}")
+        return None, 0.0
+
+    checks = []
+    for label in COGTEST_LABELS:
+        if label not in found:
+            checks.append(0.0)
+            continue
+        percentile, sten = found[label]
+        plausible = 0 <= percentile <= 100 and abs(sten - expected_sten(percentile)) <= 1
+        checks.append(1.0 if plausible else 0.5)
+    confidence = sum(checks) / len(checks)
+
+    if len(found) < len(COGTEST_LABELS):
+        return None, confidence
+    return [found[label][0] for label in COGTEST_LABELS], confidence
+
+# --- Language levels (Assessment Notes) ---
+
+# Names of each language in the order of prompt5_language: [Dutch, French, English]
+LANGUAGE_NAMES = {
+    'dutch': ['dutch', 'nederlands'],
+    'french': ['french', 'frans'],
+    'english': ['english', 'engels'],
+}
+CEFR_REG = re.compile(r'\b([ABC][12])\b')
+max_level_distance = 60  # Characters after a language name in which its level must appear
+
+def extract_language_levels(notes_text):
+    """
+    Finds explicit CEFR levels (A1-C2) stated right after the names of Dutch, French and
+    English in the notes, e.g. "Dutch\nC2 - Proficient". The text between a name and
+    its level may not mention another language. Returns (levels, confidence): levels is
+    None unless all three were found, and languages with conflicting levels lower the confidence.
+    """
+    all_names = [name for names in LANGUAGE_NAMES.values() for name in names]
+    other_language = re.compile(r'\b(' + '|'.join(all_names) + r')\b', re.IGNORECASE)
+
+    found = {}
+    for language, names in LANGUAGE_NAMES.items():
+        levels = set()
+        for match in re.finditer(r'\b(' + '|'.join(names) + r')\b', notes_text, re.IGNORECASE):
+            window = notes_text[match.end():match.end() + max_level_distance]
+            level = CEFR_REG.search(window)
+            if level and not other_language.search(window[:level.start()]):
+                levels.add(level.group(1))
+        found[language] = levels
+
+    checks = [1.0 if len(levels) == 1 else 0.5 if levels else 0.0 for levels in found.values()]
+    confidence = sum(checks) / len(checks)
+    if not all(len(levels) == 1 for levels in found.values()):
+        return None, confidence
+    return [found[language].pop() for language in LANGUAGE_NAMES], confidence
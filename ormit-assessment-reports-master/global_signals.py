@@ -1,7 +1,35 @@
-from PyQt6.QtCore import pyqtSignal, QObject
+import threading
 
-class GlobalSignals(QObject):
-    update_message = pyqtSignal(str)
+class Signal:
+    """
+    Minimal Qt-free signal: callbacks connected to it are called with the emitted values,
+    in the emitting thread. The GUI bridges these to Qt signals (see main.py), so the
+    pipeline can run without Qt from the command line or a service.
+    """
+
+    def __init__(self):
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def connect(self, callback):
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def disconnect(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def emit(self, *args):
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback(*args)
+
+class GlobalSignals:
+    def __init__(self):
+        self.update_message = Signal()  # Status message
+        self.stream_text = Signal()  # Prompt key, response text received so far
 
 # Create a global instance of the signals
 global_signals = GlobalSignals()
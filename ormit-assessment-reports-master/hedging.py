@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+from request_pool import RequestPool
+
+hedge_percentile = 90  # Send a duplicate once a call is slower than this percentile of recent calls
+min_samples = 5  # Latencies needed for a prompt before its threshold is trusted
+history_size = 50  # Recent latencies kept per prompt
+max_hedge_fraction = 0.2  # Extra requests allowed, as a fraction of all primary requests
+
+class LatencyTracker:
+    """Sliding window of recent call latencies per prompt key."""
+
+    def __init__(self, size=None):
+        self.size = size or history_size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.size)).append(seconds)
+
+    def percentile(self, key, percentile):
+        """Returns the latency percentile in seconds, or None while there are too few samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+        return samples[index]
+
+class Hedger:
+    """
+    Runs a request and, if it is slower than the hedge threshold for its prompt, sends one
+    duplicate and returns whichever answers first. The slower call is told to stop through
+    its stop event (streams stop reading at the next chunk) and its result is discarded;
+    a blocking call ends at its own request deadline. Duplicates are capped at
+    max_hedge_fraction of all primary requests made by this hedger.
+    """
+
+    def __init__(self, tracker=None, max_workers=16):
+        self.tracker = tracker or LatencyTracker()
+        self.executor = RequestPool(max_workers, thread_name_prefix='hedge')  # Daemon threads: exit does not wait
+        self.primary_requests = 0
+        self.hedged_requests = 0
+        self._lock = threading.Lock()
+
+    def _allow_hedge(self):
+        with self._lock:
+            if self.hedged_requests + 1 > max_hedge_fraction * self.primary_requests:
+                return False
+            self.hedged_requests += 1
+            return True
+
+    def run(self, key, request, enabled=True, before_hedge=None):
+        """
+        Calls request(stop_event) and returns its result. before_hedge() is called
+        before a duplicate is sent, e.g. to take a slot from the rate limiter.
+        """
+        with self._lock:
+            self.primary_requests += 1
+        threshold = self.tracker.percentile(key, hedge_percentile) if enabled else None
+        start = time.monotonic()
+
+        if threshold is None:
+            result = request(threading.Event())
+            self.tracker.record(key, time.monotonic() - start)
+            return result
+
+        stops = {}
+        primary_stop = threading.Event()
+        primary = self.executor.submit(request, primary_stop)
+        stops[primary] = primary_stop
+        done, _ = wait([primary], timeout=threshold)
+        if done or not self._allow_hedge():
+            result = primary.result()
+            self.tracker.record(key, time.monotonic() - start)
+            return result
+
+        print(f"Hedging {key}: no answer after {threshold:.1f}s")
+        if before_hedge:
+            before_hedge()
+        hedge_stop = threading.Event()
+        hedge = self.executor.submit(request, hedge_stop)
+        stops[hedge] = hedge_stop
+
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None or not pending:
+                    for other in pending:
+                        stops[other].set()
+                        other.cancel()
+                    self.tracker.record(key, time.monotonic() - start)
+                    return future.result()
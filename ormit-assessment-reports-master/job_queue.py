@@ -0,0 +1,241 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+queue_path = 'jobs.db'
+lease_seconds = 120  # A running job whose lease is not renewed within this time is handed out again
+max_job_attempts = 3
+
+# Stages in pipeline order, recorded as each one completes
+STAGES = ['redacted', 'extracted', 'prompted', 'rendered']
+
+# Payload fields that are never written to the database; the runner supplies them again
+SECRET_FIELDS = ["Gemini Key"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    stage TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    timings TEXT NOT NULL DEFAULT '{}',
+    artifacts TEXT NOT NULL DEFAULT '{}',
+    error TEXT,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority DESC, submitted);
+CREATE TABLE IF NOT EXISTS job_keys (
+    key TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL
+);
+"""
+
+class JobQueue:
+    """
+    Durable job queue in SQLite (WAL mode). Jobs are claimed with a lease that the worker
+    renews while it runs; a job whose worker died is claimed again once its lease expires,
+    so every job runs at least once. Higher priorities are claimed first, then oldest first.
+    Each job records its completed stages, per-stage timings and artifacts (file paths).
+    The payload is the GUI_data dictionary without the API key (SECRET_FIELDS).
+    """
+
+    def __init__(self, path=None, lease=None):
+        self.path = path or queue_path
+        self.lease = lease or lease_seconds
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA busy_timeout=5000")  # Other processes may share the queue
+        self.db.executescript(SCHEMA)
+        # Queues written by earlier versions stored the key with the payload
+        for field in SECRET_FIELDS:
+            path = f'$."{field}"'
+            self.db.execute("UPDATE jobs SET payload = json_remove(payload, ?) "
+                            "WHERE json_extract(payload, ?) IS NOT NULL", (path, path))
+
+    def _execute(self, sql, params=()):
+        with self.lock:
+            return self.db.execute(sql, params)
+
+    def enqueue(self, payload, priority=0, max_attempts=None):
+        job_id = uuid.uuid4().hex
+        self._execute("INSERT INTO jobs (id, payload, priority, max_attempts, submitted) VALUES (?, ?, ?, ?, ?)",
+                      (job_id, _stored_payload(payload), priority, max_attempts or max_job_attempts, time.time()))
+        return job_id
+
+    def enqueue_once(self, payload, key, priority=0, max_attempts=None):
+        """
+        Enqueues a job unless one that is queued, running or done was already submitted under
+        key (e.g. a content hash); a failed or cancelled one is replaced by a new job.
+        Returns (job id, True for a new job / False for the existing one).
+        """
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute("SELECT job_keys.job_id, jobs.status FROM job_keys "
+                                      "LEFT JOIN jobs ON jobs.id = job_keys.job_id WHERE key = ?", (key,)).fetchone()
+                if row and row['status'] in ('queued', 'running', 'done'):
+                    self.db.execute("COMMIT")
+                    return row['job_id'], False
+                job_id = uuid.uuid4().hex
+                self.db.execute("INSERT INTO jobs (id, payload, priority, max_attempts, submitted) VALUES (?, ?, ?, ?, ?)",
+                                (job_id, _stored_payload(payload), priority, max_attempts or max_job_attempts, time.time()))
+                self.db.execute("INSERT OR REPLACE INTO job_keys (key, job_id) VALUES (?, ?)", (key, job_id))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return job_id, True
+
+    def claim(self, worker_id):
+        """Leases the next job to worker_id and returns it, or None when nothing is runnable."""
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose worker stopped renewing the lease are given up when they were to be
+                # cancelled or have no attempts left
+                self.db.execute("UPDATE jobs SET status = 'cancelled', finished = ?, lease_owner = NULL "
+                                "WHERE status = 'running' AND lease_expires < ? AND cancel_requested = 1",
+                                (now, now))
+                self.db.execute("UPDATE jobs SET status = 'failed', finished = ?, lease_owner = NULL, "
+                                "error = 'Worker lost (lease expired) on every attempt' "
+                                "WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+                                (now, now))
+                row = self.db.execute(
+                    "SELECT id FROM jobs WHERE cancel_requested = 0 AND "
+                    "(status = 'queued' OR (status = 'running' AND lease_expires < ?)) "
+                    "ORDER BY priority DESC, submitted LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    self.db.execute("COMMIT")
+                    return None
+                self.db.execute("UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires = ?, "
+                                "attempts = attempts + 1, started = COALESCE(started, ?) WHERE id = ?",
+                                (worker_id, now + self.lease, now, row['id']))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return self.get(row['id'])
+
+    def renew(self, job_id, worker_id):
+        """Extends the lease. Returns False when the lease was lost or the job should be cancelled."""
+        cursor = self._execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ? "
+                               "AND status = 'running' AND cancel_requested = 0",
+                               (time.time() + self.lease, job_id, worker_id))
+        return cursor.rowcount == 1
+
+    def record_stage(self, job_id, stage, seconds=None, **artifacts):
+        """Marks stage as completed, adding its duration and any artifact paths."""
+        job = self.get(job_id)
+        timings = dict(job['timings'], **({stage: round(seconds, 2)} if seconds is not None else {}))
+        self._execute("UPDATE jobs SET stage = ?, timings = ?, artifacts = ? WHERE id = ?",
+                      (stage, json.dumps(timings), json.dumps(dict(job['artifacts'], **artifacts)), job_id))
+
+    def complete(self, job_id, worker_id):
+        self._finish(job_id, worker_id, 'done', None)
+
+    def fail(self, job_id, worker_id, error, retry=False):
+        """Records a failure; with retry=True the job is queued again while attempts remain."""
+        if retry:
+            cursor = self._execute("UPDATE jobs SET status = 'queued', lease_owner = NULL, error = ? "
+                                   "WHERE id = ? AND lease_owner = ? AND attempts < max_attempts "
+                                   "AND cancel_requested = 0", (error, job_id, worker_id))
+            if cursor.rowcount:
+                return
+        self._finish(job_id, worker_id, 'cancelled' if self.cancel_requested(job_id) else 'failed', error)
+
+    def mark_cancelled(self, job_id, worker_id):
+        self._finish(job_id, worker_id, 'cancelled', None)
+
+    def _finish(self, job_id, worker_id, status, error):
+        self._execute("UPDATE jobs SET status = ?, error = ?, finished = ?, lease_owner = NULL "
+                      "WHERE id = ? AND lease_owner = ?", (status, error, time.time(), job_id, worker_id))
+
+    def cancel(self, job_id):
+        """Cancels a queued job right away; a running job is flagged and stopped by its worker."""
+        now = time.time()
+        self._execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+                      (now, job_id))
+        self._execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        return self.get(job_id)
+
+    def cancel_requested(self, job_id):
+        row = self._execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def requeue_interrupted(self, worker_prefix=None):
+        """
+        Puts running jobs back in the queue straight away instead of waiting for their leases,
+        e.g. at start-up when the previous process using this queue died. As for expired leases
+        in claim(), jobs that were to be cancelled are marked cancelled and jobs with no attempts
+        left are marked failed, so a job that crashes the process does not run on every restart.
+        worker_prefix limits this to the workers of one process that is shutting down; its jobs
+        were stopped, not lost, so they get their attempt back. Returns the number of jobs queued again.
+        """
+        now = time.time()
+        condition = "status = 'running'"
+        params = ()
+        if worker_prefix:
+            condition += " AND lease_owner LIKE ?"
+            params = (f"{worker_prefix}%",)
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute(f"UPDATE jobs SET status = 'cancelled', finished = ?, lease_owner = NULL "
+                                f"WHERE {condition} AND cancel_requested = 1", (now,) + params)
+                if worker_prefix:
+                    self.db.execute(f"UPDATE jobs SET attempts = MAX(attempts - 1, 0) WHERE {condition}", params)
+                else:
+                    self.db.execute(f"UPDATE jobs SET status = 'failed', finished = ?, lease_owner = NULL, "
+                                    f"error = 'Worker lost (service stopped) on every attempt' "
+                                    f"WHERE {condition} AND attempts >= max_attempts", (now,) + params)
+                requeued = self.db.execute(f"UPDATE jobs SET status = 'queued', lease_owner = NULL "
+                                           f"WHERE {condition}", params).rowcount
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return requeued
+
+    def get(self, job_id):
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def list(self, status=None, limit=200):
+        if status:
+            rows = self._execute("SELECT * FROM jobs WHERE status = ? ORDER BY submitted DESC LIMIT ?",
+                                 (status, limit)).fetchall()
+        else:
+            rows = self._execute("SELECT * FROM jobs ORDER BY submitted DESC LIMIT ?", (limit,)).fetchall()
+        return [_row_to_job(row) for row in rows]
+
+    def counts(self):
+        return {row['status']: row['n'] for row in
+                self._execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()}
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def _stored_payload(payload):
+    return json.dumps({key: value for key, value in payload.items() if key not in SECRET_FIELDS})
+
+def _row_to_job(row):
+    job = dict(row)
+    for field in ['payload', 'timings', 'artifacts']:
+        job[field] = json.loads(job[field])
+    job['cancel_requested'] = bool(job['cancel_requested'])
+    return job
@@ -0,0 +1,237 @@
+import asyncio
+import itertools
+import json
+import re
+import threading
+import time
+from datetime import timedelta
+from token_budget import estimate_tokens
+
+default_model = "gemini-2.0-flash-001"
+cache_ttl = timedelta(minutes=10)  # Provider-side context caches only need to outlive one run
+http_pool_size = 8  # Keep-alive connections per OpenAI-compatible server
+
+class LLMBackend:
+    """
+    Interface of a model backend. generate() returns the response text, or an iterator
+    of text chunks when stream=True. generation_config uses the Gemini field names
+    (max_output_tokens, temperature, response_mime_type, response_schema, ...).
+    timeout is the request deadline in seconds, enforced by the transport while in flight.
+    With candidate_count > 1 in generation_config (not streamed), generate() returns
+    a list with the text of every candidate, all produced by one request.
+    """
+    model_name = ""
+
+    def generate(self, prompt, generation_config=None, stream=False, cached_context=None, timeout=None):
+        raise NotImplementedError
+
+    async def agenerate(self, prompt, generation_config=None, cached_context=None, timeout=None):
+        return await asyncio.to_thread(self.generate, prompt, generation_config, False, cached_context, timeout)
+
+    def count_tokens(self, text):
+        return estimate_tokens(text)
+
+    def create_cached_context(self, text):
+        """Registers text as a reusable prefix and returns its handle."""
+        raise NotImplementedError(f"{type(self).__name__} does not support context caching")
+
+    def delete_cached_context(self, handle):
+        pass
+
+class GeminiBackend(LLMBackend):
+    """
+    Gemini through google.generativeai. Backends are shared per API key and model
+    (see get_backend), so the clients and their connections are reused across runs.
+    Every backend has its own API clients: genai.configure() sets one key for the whole
+    process, and the report service runs jobs with different keys side by side.
+    """
+
+    def __init__(self, api_key, model_name=None):
+        import google.generativeai as genai
+        from google.ai import generativelanguage as glm
+        self.genai = genai
+        self.glm = glm
+        client_options = {'api_key': api_key}
+        self._client = glm.GenerativeServiceClient(client_options=client_options)
+        self._async_client = glm.GenerativeServiceAsyncClient(client_options=client_options)
+        self._cache_client = glm.CacheServiceClient(client_options=client_options)
+        self.model = self._with_clients(genai.GenerativeModel(model_name=model_name or default_model))
+        self.model_name = self.model.model_name
+        self._cached_models = {}
+
+    def _with_clients(self, model):
+        # GenerativeModel otherwise takes the clients of the global configuration on first use
+        model._client = self._client
+        model._async_client = self._async_client
+        return model
+
+    def _model_for(self, cached_context):
+        return self._cached_models[cached_context] if cached_context else self.model
+
+    def generate(self, prompt, generation_config=None, stream=False, cached_context=None, timeout=None):
+        response = self._model_for(cached_context).generate_content(
+            prompt, generation_config=generation_config, stream=stream,
+            request_options={"timeout": timeout} if timeout else None)
+        if stream:
+            return _gemini_chunks(response)
+        if _candidate_count(generation_config) > 1:
+            return ["".join(part.text for part in candidate.content.parts) for candidate in response.candidates]
+        return response.text
+
+    async def agenerate(self, prompt, generation_config=None, cached_context=None, timeout=None):
+        response = await self._model_for(cached_context).generate_content_async(
+            prompt, generation_config=generation_config,
+            request_options={"timeout": timeout} if timeout else None)
+        return response.text
+
+    def count_tokens(self, text):
+        return self.model.count_tokens(text).total_tokens
+
+    def create_cached_context(self, text):
+        request = self.glm.CreateCachedContentRequest(cached_content=self.glm.CachedContent(
+            model=self.model_name,
+            display_name=f"assessment-{int(time.time())}",
+            contents=[self.glm.Content(role='user', parts=[self.glm.Part(text=text)])],
+            ttl=cache_ttl,
+        ))
+        cache = self.genai.caching.CachedContent._from_obj(self._cache_client.create_cached_content(request))
+        self._cached_models[cache.name] = self._with_clients(
+            self.genai.GenerativeModel.from_cached_content(cached_content=cache))
+        return cache.name
+
+    def delete_cached_context(self, handle):
+        if self._cached_models.pop(handle, None) is not None:
+            self._cache_client.delete_cached_content(name=handle)
+
+def _candidate_count(generation_config):
+    return (generation_config or {}).get('candidate_count') or 1
+
+def _gemini_chunks(response):
+    for chunk in response:
+        try:
+            yield chunk.text
+        except ValueError:  # Chunk without text parts, e.g. the final finish-reason chunk
+            continue
+
+class OpenAICompatibleBackend(LLMBackend):
+    """
+    Any server with an OpenAI-style /chat/completions endpoint (vLLM, llama.cpp,
+    Ollama, LM Studio, ...). One pooled keep-alive HTTP session is shared by all calls.
+    """
+
+    def __init__(self, base_url, api_key="", model_name=None, timeout=120):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.model_name = model_name or default_model
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=http_pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if api_key:
+            self.session.headers['Authorization'] = f"Bearer {api_key}"
+
+    def _payload(self, prompt, generation_config, stream):
+        config = generation_config or {}
+        payload = {
+            'model': self.model_name,
+            'messages': [{'role': 'user', 'content': prompt}],
+            'stream': stream,
+        }
+        if 'max_output_tokens' in config:
+            payload['max_tokens'] = config['max_output_tokens']
+        if 'temperature' in config:
+            payload['temperature'] = config['temperature']
+        if _candidate_count(config) > 1:
+            payload['n'] = config['candidate_count']
+        if config.get('response_mime_type') == 'application/json':
+            payload['response_format'] = {'type': 'json_object'}
+        return payload
+
+    def generate(self, prompt, generation_config=None, stream=False, cached_context=None, timeout=None):
+        response = self.session.post(f"{self.base_url}/chat/completions",
+                                     json=self._payload(prompt, generation_config, stream),
+                                     timeout=timeout or self.timeout, stream=stream)
+        response.raise_for_status()
+        if stream:
+            return _sse_chunks(response)
+        choices = response.json()['choices']
+        if _candidate_count(generation_config) > 1:
+            return [choice['message']['content'] for choice in choices]
+        return choices[0]['message']['content']
+
+def _sse_chunks(response):
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            break
+        delta = json.loads(data)['choices'][0].get('delta', {})
+        if delta.get('content'):
+            yield delta['content']
+
+class FakeBackend(LLMBackend):
+    """
+    In-process backend for tests and offline benchmarks. Answers with the prompt's own
+    'Example: "..."' line when it has one, so list prompts get well-formed output.
+    """
+    model_name = "fake"
+
+    def __init__(self, responder=None, latency=0.0):
+        self.responder = responder or self._example_answer
+        self.latency = latency
+        self.calls = 0
+        self._contexts = {}
+        self._handles = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _example_answer(prompt):
+        match = re.search(r'Example: "([^"]*)"', prompt)
+        return match.group(1) if match else "Piet made a calm and friendly first impression."
+
+    def generate(self, prompt, generation_config=None, stream=False, cached_context=None, timeout=None):
+        with self._lock:
+            self.calls += 1
+        if cached_context:
+            prompt = f"{prompt}\n\n{self._contexts[cached_context]}"
+        if timeout and self.latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Fake request exceeded its {timeout}s deadline")
+        time.sleep(self.latency)
+        if _candidate_count(generation_config) > 1 and not stream:
+            return [self.responder(prompt) for _ in range(generation_config['candidate_count'])]
+        text = self.responder(prompt)
+        if stream:
+            return iter([text[i:i + 20] for i in range(0, len(text), 20)])
+        return text
+
+    def create_cached_context(self, text):
+        handle = f"fake-{next(self._handles)}"
+        self._contexts[handle] = text
+        return handle
+
+    def delete_cached_context(self, handle):
+        self._contexts.pop(handle, None)
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_backend(kind, api_key="", model_name=None, base_url=None):
+    """
+    Returns the backend for these settings, creating it on first use. Backends are kept
+    for the lifetime of the process so clients and connection pools are reused.
+    """
+    key = (kind, api_key, model_name, base_url)
+    with _backends_lock:
+        if key not in _backends:
+            if kind == 'gemini':
+                _backends[key] = GeminiBackend(api_key, model_name)
+            elif kind == 'openai':
+                _backends[key] = OpenAICompatibleBackend(base_url, api_key, model_name)
+            elif kind == 'fake':
+                _backends[key] = FakeBackend()
+            else:
+                raise ValueError(f"Unknown LLM backend: {kind}")
+        return _backends[key]
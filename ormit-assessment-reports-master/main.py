@@ -1,19 +1,21 @@
 import sys
 import os
-from PyQt6.QtCore import QThread, pyqtSignal
+import threading
+import time
+_launch_time = time.perf_counter()
+from PyQt6.QtCore import QThread, pyqtSignal, QObject
 from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import (QApplication, QWidget, QPushButton, QLineEdit, QLabel,
                              QGridLayout, QFileDialog, QComboBox, QMessageBox)
 from PyQt6.QtGui import QPixmap, QFont, QIcon
-from redact import *
-from prompting import *
 from time import sleep
+# Only light modules are imported here, so the window appears with just Qt loaded.
+# The pipeline (fitz, Gemini, PyPDF2, python-docx) is imported by the warm-up thread.
 from global_signals import global_signals
-from write_report_mcp import clean_up
-
-# Import write_report modules (MCP and DATA)
-import write_report_mcp as mcp_write_report
-import write_report_data as data_write_report
+from cancellation import CancelToken, JobCancelled
+from warmup import startup_report, start_warm_up, start_backend_configuration
+from service_client import ServiceClient, ServiceError
+startup_report.record('imports', 'PyQt6', {'seconds': round(time.perf_counter() - _launch_time, 3)})
 
 ##For debugging only:
 #print('YOU NEED TO COMMENT THIS OUT BEFORE EXE')
@@ -35,35 +37,105 @@ icon_path_abs = "resources/assessmentReport.ico"
 logo_path = resource_path(logo_path_abs)
 icon_path = resource_path(icon_path_abs)
 
+# Hand jobs to a running report service (python -m report_service) when one is reachable;
+# otherwise reports are produced in this process
+use_report_service = True
+report_service_url = 'http://127.0.0.1:8765'
+service_poll_interval = 1  # Seconds between status checks
+
+STAGE_MESSAGES = {
+    'queued': "Waiting for the report service...",
+    'redact': "Redacting files...",
+    'prompt': "Drafting the report with Gemini...",
+    'render': "Writing the report...",
+}
+
+class ServiceProbe:
+    """Checks once, off the GUI thread, whether the report service is running."""
+
+    def __init__(self, url):
+        self.client = ServiceClient(url)
+        self.available = False  # Until the check has answered
+
+    def start(self, when_unavailable=None):
+        def probe():
+            self.available = self.client.available()
+            if not self.available and when_unavailable:
+                when_unavailable()
+        threading.Thread(target=probe, name='service-probe', daemon=True).start()
+
+service_probe = ServiceProbe(report_service_url)
+
 programs = ['MCP', 'DATA']
 genders = ['M', 'F']
 
+class QtSignalBridge(QObject):
+    """Re-emits the pipeline's plain signals as Qt signals, so the slots run in the GUI thread."""
+    update_message = pyqtSignal(str)
+    stream_text = pyqtSignal(str, str)
+
+    def __init__(self):
+        super().__init__()
+        global_signals.update_message.connect(self.update_message.emit)
+        global_signals.stream_text.connect(self.stream_text.emit)
+
 class ProcessingThread(QThread):
     processing_completed = pyqtSignal(str)  # Signal to emit when processing is done
 
-    def __init__(self, GUI_data):
+    def __init__(self, GUI_data, service=None):
         super().__init__()
         self.GUI_data = GUI_data
+        self.service = service
+        self.cancel_token = CancelToken()
+
+    def cancel(self):
+        # Redaction, prompting and rendering stop at their next checkpoint
+        self.cancel_token.cancel()
+
+    def run_on_service(self):
+        # Submit the job, follow its stages and download the finished report
+        job_id = self.service.submit(self.GUI_data)
+        stage = None
+        while True:
+            if self.cancel_token.wait(service_poll_interval):
+                self.service.cancel(job_id)
+                raise JobCancelled(self.cancel_token.reason)
+            status = self.service.status(job_id)
+            if status['status'] == 'done':
+                return self.service.download(job_id)
+            if status['status'] in ('failed', 'cancelled'):
+                global_signals.update_message.emit(f"Report service: job {status['status']} ({status['error']})")
+                return None
+            current = status['stage'] or status['status']
+            if current != stage:
+                stage = current
+                global_signals.update_message.emit(STAGE_MESSAGES.get(stage, "Processing..."))
 
     def run(self):
-        # Redact and store files
-        redact_folder(self.GUI_data)
-        print('Redaction completed')
-
-        # Send prompts to OpenAI
-        output_path = send_prompts(self.GUI_data)
-        print('Drafting completed')
-
-        # Convert JSON to report
-        clean_data = clean_up(output_path)
-        selected_program = self.GUI_data["Traineeship"]
-        if selected_program == 'MCP':
-            updated_doc = mcp_write_report.update_document(clean_data, self.GUI_data["Applicant Name"], self.GUI_data["Assessor Name"], self.GUI_data["Gender"], self.GUI_data["Traineeship"])
-        elif selected_program == 'DATA':
-            updated_doc = data_write_report.update_document(clean_data, self.GUI_data["Applicant Name"], self.GUI_data["Assessor Name"], self.GUI_data["Gender"], self.GUI_data["Traineeship"])
-        else:
-            updated_doc = mcp_write_report.update_document(clean_data, self.GUI_data["Applicant Name"], self.GUI_data["Assessor Name"], self.GUI_data["Gender"], self.GUI_data["Traineeship"]) # Default to MCP if program is not recognized
-        print('Writing completed')
+        try:
+            # Checked here rather than in the GUI thread; without a service the job runs locally
+            if self.service is not None and not self.service.available():
+                self.service = None
+            if self.service is not None:
+                updated_doc = self.run_on_service()
+            else:
+                # Usually already imported by the warm-up thread
+                from pipeline import run_pipeline
+
+                # Redact, prompt and write the report (see pipeline.py)
+                updated_doc = run_pipeline(self.GUI_data, self.cancel_token)['report']
+        except JobCancelled:
+            print('Processing cancelled')
+            return
+        except ServiceError as e:
+            print(f"Report service error: {e}")
+            global_signals.update_message.emit(f"Report service error: {e}")
+            return
+        if not updated_doc:
+            # The reason is already shown in the message box, which stays open
+            if self.service is None:
+                global_signals.update_message.emit("The report could not be written, see the log for details.")
+            return
 
         # Emit the path of the generated document
         self.processing_completed.emit(updated_doc)
@@ -91,7 +163,9 @@ class MainWindow(QWidget):
         self.msg_box.setStandardButtons(QMessageBox.StandardButton.Close)  # Add Close button
         self.msg_box.button(QMessageBox.StandardButton.Close).clicked.connect(self.close_application)
 
-        global_signals.update_message.connect(self.refresh_message_box)
+        self.signal_bridge = QtSignalBridge()
+        self.signal_bridge.update_message.connect(self.refresh_message_box)
+        self.signal_bridge.stream_text.connect(self.show_streamed_text)
 
         # Load the logo
         pixmap = QPixmap(logo_path)
@@ -113,6 +187,7 @@ class MainWindow(QWidget):
         layout.addWidget(self.key_label, 1, 0)
 
         self.openai_key_input = QLineEdit(placeholderText='Enter Gemini Key: ***************')
+        self.openai_key_input.editingFinished.connect(self.configure_backend)
         layout.addWidget(self.openai_key_input, 1, 1, 1, 2)
 
         # Applicant information
@@ -185,12 +260,32 @@ class MainWindow(QWidget):
         # Counter for selected files
         self.selected_files_count = 0
 
+    def configure_backend(self):
+        # Set up the Gemini client in the background while the rest of the form is filled in
+        key = self.openai_key_input.text().strip()
+        if use_report_service and service_probe.available:
+            return
+        if key and key != getattr(self, 'configured_key', None):
+            self.configured_key = key
+            start_backend_configuration(key)
+
     def refresh_message_box(self, message):
         self.msg_box.setText(message)
         self.msg_box.show()
+    def show_streamed_text(self, prompt_key, text):
+        # Show the tail of a long-form section while it is being written
+        self.msg_box.setInformativeText(text[-600:])
+        self.msg_box.show()
     def close_application(self):
-        # This will close the application when the messagebox is closed manually
-        QApplication.quit()
+        # This will close the application when the messagebox is closed manually.
+        # Running work is cancelled first; the application quits once the thread has stopped.
+        # Requests still in flight run on daemon threads (request_pool.py), so they don't delay the exit.
+        thread = getattr(self, 'processing_thread', None)
+        if thread is not None and thread.isRunning():
+            thread.finished.connect(QApplication.quit)
+            thread.cancel()
+        else:
+            QApplication.quit()
 
     def open_file_dialog(self, file_index):
         dialog = QFileDialog(self)
@@ -238,7 +333,8 @@ class MainWindow(QWidget):
         }
 
         # Start the processing thread
-        self.processing_thread = ProcessingThread(GUI_data)
+        service = ServiceClient(report_service_url) if use_report_service else None
+        self.processing_thread = ProcessingThread(GUI_data, service)
         self.processing_thread.processing_completed.connect(self.on_processing_completed)
         self.processing_thread.start()
 
@@ -254,4 +350,10 @@ if __name__ == '__main__':
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
+    startup_report.record('startup', 'window_shown_seconds', round(time.perf_counter() - _launch_time, 3))
+    # A running report service keeps the pipeline warm itself
+    if use_report_service:
+        service_probe.start(when_unavailable=start_warm_up)
+    else:
+        start_warm_up()
     sys.exit(app.exec())  # Event loop terminates when MainWindow closes
@@ -0,0 +1,67 @@
+import os
+import time
+import uuid
+from redact import redact_folder
+from prompting import send_prompts
+from write_report_mcp import clean_up
+import write_report_mcp as mcp_write_report
+import write_report_data as data_write_report
+from cancellation import check_cancelled
+from workspace import Workspace
+
+def render_report(clean_data, GUI_data, cancel_token=None, output_folder='.', run_id=None):
+    """Writes the Word report with the template of the candidate's traineeship and returns its path."""
+    selected_program = GUI_data["Traineeship"]
+    if selected_program == 'DATA':
+        write_report = data_write_report
+    else:
+        write_report = mcp_write_report  # Default to MCP if program is not recognized
+    return write_report.update_document(clean_data, GUI_data["Applicant Name"], GUI_data["Assessor Name"],
+                                        GUI_data["Gender"], GUI_data["Traineeship"], cancel_token, output_folder,
+                                        run_id)
+
+def run_pipeline(GUI_data, cancel_token=None, on_stage=None, results_path=None, output_folder='.', run_id=None):
+    """
+    Redacts the candidate's files, runs the prompts and renders the report.
+    GUI_data holds the same fields as the GUI form (key, names, gender, traineeship, files).
+    on_stage(stage, **artifacts) is called when 'redact', 'extract' (reading files and local
+    extraction), 'prompt' and 'render' start; 'render' passes the results file as results=path.
+    With the results_path of an earlier run, only the report is rendered again.
+    The redacted files live in a private workspace that is removed afterwards, so pipelines
+    can run at the same time; the results JSON and the report are written to output_folder,
+    with run_id (e.g. the job id; a new id by default) in their names so they don't collide.
+    Returns {'report': path or None, 'results': path of the prompt outputs, 'timings': seconds per stage}.
+    Raises JobCancelled when cancel_token fires.
+    """
+    on_stage = on_stage or (lambda stage, **artifacts: None)
+    timings = {}
+    run_id = run_id or uuid.uuid4().hex[:8]
+    output_path = results_path if results_path and os.path.exists(results_path) else None
+    os.makedirs(output_folder, exist_ok=True)
+    if output_path is None:
+        with Workspace() as workspace:
+            on_stage('redact')
+            start = time.time()
+            redact_folder(GUI_data, cancel_token=cancel_token, output_folder=workspace.path)
+            timings['redact'] = round(time.time() - start, 2)
+            print('Redaction completed')
+
+            # Send prompts to Gemini
+            on_stage('extract')
+            start = time.time()
+            output_path = send_prompts(GUI_data, cancel_token, on_stage, workspace.path, output_folder, run_id)
+            timings['prompt'] = round(time.time() - start, 2)
+            print('Drafting completed')
+    else:
+        print(f"Rendering from existing results {output_path}")
+
+    # Convert JSON to report
+    check_cancelled(cancel_token)
+    on_stage('render', results=output_path)
+    start = time.time()
+    clean_data = clean_up(output_path)
+    updated_doc = render_report(clean_data, GUI_data, cancel_token, output_folder, run_id)
+    timings['render'] = round(time.time() - start, 2)
+    print('Writing completed')
+
+    return {'report': updated_doc, 'results': output_path, 'timings': timings}
@@ -1,13 +1,28 @@
-import google.generativeai as genai
 import time
 from datetime import datetime
 import json
 from global_signals import global_signals
+from context_cache import SharedContext, ProviderContextCache, LocalContextCache
+from llm_backends import get_backend, default_model
+from response_cache import ResponseCache, response_key
+from rate_limit import call_with_retry, shared_limiter
+from retrieval import BM25Index, chunk_text
+from cancellation import JobCancelled, check_cancelled
+from hedging import Hedger
+from request_pool import RequestPool
+import token_budget
+from token_budget import estimate_tokens
+import extractors
+from extractors import extract_cogtest_scores, extract_language_levels
 import re
 import os
 import PyPDF2
+import numpy as np
 from docx import Document
 import ast
+import hashlib
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
 
 def read_pdf(file_path):
     """Reads and returns text from a PDF file."""
@@ -21,8 +36,16 @@ def read_pdf(file_path):
         print(f"Error reading PDF {file_path}: {e}")
     return text
 
+_docx_texts = {}  # (path, modification time) -> text; resource documents are parsed once per process
+
 def read_docx(file_path):
     """Reads and returns text from a DOCX file."""
+    try:
+        cache_key = (os.path.abspath(file_path), os.path.getmtime(file_path))
+    except OSError:
+        cache_key = None
+    if cache_key in _docx_texts:
+        return _docx_texts[cache_key]
     text = ""
     try:
         doc = Document(file_path)
@@ -30,6 +53,9 @@ def read_docx(file_path):
             text += paragraph.text + "\n"
     except Exception as e:
         print(f"Error reading DOCX {file_path}: {e}")
+        return text
+    if cache_key is not None:
+        _docx_texts[cache_key] = text
     return text
 
 def _extract_list_from_string(text):
@@ -50,7 +76,176 @@ def _extract_list_from_string(text):
             pass  # Fallthrough to return None if parsing fails
     return '[]'  # Return empty list *string* if no valid list found
 
-max_wait_time = 200
+# Resource documents sent along with the candidate's files
+path_to_contextfile = r'resources/Context and Task Description.docx'
+path_to_toneofvoice = r'resources/Examples Personality Section.docx'
+path_to_mcpprofile = r'resources/The MCP Profile.docx'
+path_to_dataprofile = r'resources/The Data Chiefs profile.docx'
+resource_documents = [path_to_contextfile, path_to_toneofvoice, path_to_mcpprofile, path_to_dataprofile]
+
+def preload_resources():
+    """Parses the resource documents ahead of the first run (used by the start-up warm-up)."""
+    for file_path in resource_documents:
+        if os.path.exists(file_path):
+            read_docx(file_path)
+
+max_wait_time = 200  # Overall limit for one run; requests still in flight at that point are abandoned
+
+# Deadline per request attempt, enforced by the backend while the request is in flight.
+# A timed-out attempt is retried within the prompt's attempt budget.
+prompt_timeout = 60
+prompt_timeouts = {
+    'prompt3_personality': 120,
+}
+max_concurrent_prompts = 4  # Number of Gemini requests allowed in flight at once
+
+# Model backend: 'gemini', 'openai' (any OpenAI-compatible server at openai_base_url,
+# e.g. a local one) or 'fake' (in-process, for tests and offline benchmarks)
+llm_backend = 'gemini'
+model_name = default_model
+openai_base_url = 'http://localhost:8000/v1'
+openai_api_key = os.environ.get('OPENAI_API_KEY', '')  # Sent to openai_base_url; the Gemini key never is
+
+# Model tiers: every prompt runs on the model and generation settings of its tier
+# (model None = model_name). Short extraction lists go to a faster model, and all list
+# prompts get tight output limits; prose prompts keep the default model and settings.
+# Prompts that are not listed in prompt_tiers use default_tier. Tier models must exist
+# on the selected backend; set use_model_tiers = False to run everything on model_name.
+use_model_tiers = True
+model_tiers = {
+    'prose': {'model': None},
+    'judgement': {'model': None, 'max_output_tokens': 256, 'temperature': 0.2},
+    'extraction': {'model': 'gemini-2.0-flash-lite-001', 'max_output_tokens': 128, 'temperature': 0.0},
+    'structured': {'model': None, 'max_output_tokens': 1024, 'temperature': 0.2},
+}
+default_tier = 'prose'
+prompt_tiers = {
+    'prompt4_cogcap_scores': 'extraction',
+    'prompt5_language': 'extraction',
+    'prompt8_datatools': 'extraction',
+    'prompt9_interests': 'extraction',
+    'prompt6a_conqual': 'judgement',
+    'prompt6b_conimprov': 'judgement',
+    'prompt7_qualscore': 'judgement',
+    'prompt7_qualscore_data': 'judgement',
+    'structured_lists': 'structured',
+}
+
+# Where the shared file context is cached: 'provider' (the backend's own caching, e.g. Gemini
+# cached content), 'local' (in-process stand-in for tests) or None (send the full context with every prompt)
+context_cache_backend = 'provider'
+# Contexts are only cached when at least two requests of a run share them and, for provider
+# caching, when they reach the provider's minimum size (Gemini rejects smaller cached contents)
+min_cached_context_tokens = 4096
+
+# Reuse earlier outputs when the model, prompt and redacted inputs are unchanged.
+# Set to False to bypass the on-disk response cache (see response_cache.py for size/TTL).
+use_response_cache = True
+
+# Files each prompt needs. Prompts that are not listed receive every file.
+# PROFILE stands for the MCP or Data Chiefs profile, depending on the traineeship.
+route_prompt_inputs = True
+PROFILE = 'profile'
+NOTES, PAPI, COGTEST = 'Assessment Notes.pdf', 'PAPI Feedback.pdf', 'Cog. Test.pdf'
+CONTEXT_DOC, EXAMPLES_DOC = 'Context and Task Description.docx', 'Examples Personality Section.docx'
+prompt_inputs = {
+    'prompt2_firstimpr': [NOTES],
+    'prompt3_personality': [NOTES, PAPI, CONTEXT_DOC, EXAMPLES_DOC],
+    'prompt4_cogcap_scores': [COGTEST, CONTEXT_DOC],
+    'prompt4_cogcap_remarks': [COGTEST],
+    'prompt5_language': [NOTES, CONTEXT_DOC],
+    'prompt6a_conqual': [NOTES, PAPI, CONTEXT_DOC],
+    'prompt6b_conimprov': [NOTES, PAPI, CONTEXT_DOC],
+    'prompt7_qualscore': [NOTES, PAPI, CONTEXT_DOC, PROFILE],
+    'prompt7_qualscore_data': [NOTES, PAPI, CONTEXT_DOC, PROFILE],
+    'prompt8_datatools': [NOTES],
+    'prompt9_interests': [NOTES],
+}
+
+# Long candidate documents are reduced to the chunks most relevant to each prompt
+# (local BM25 ranking). Documents within the budget, and all resource documents, are
+# always sent whole; set use_retrieval = False to always send full documents.
+use_retrieval = True
+retrieval_token_budget = 6000  # Per document, per prompt
+retrieval_files = [NOTES, PAPI]
+# Short search terms per prompt, in English and Dutch like the notes. Prompts without an
+# entry (the prose sections) always get the full documents.
+retrieval_queries = {
+    'prompt5_language': "language languages level english french dutch german native fluent "
+                        "taal talen niveau engels frans nederlands duits moedertaal vloeiend",
+    'prompt6a_conqual': "strengths qualities strong positive good skills "
+                        "sterktes sterk kwaliteiten positief goed vaardigheden",
+    'prompt6b_conimprov': "improvement development weakness growth difficult feedback "
+                          "werkpunten werkpunt verbeteren ontwikkeling zwakte groeien moeilijk",
+    'prompt7_qualscore': "teamwork collaborative learning proactive assertive communication leadership client "
+                         "samenwerken team leren proactief assertief communicatie leiderschap klant",
+    'prompt7_qualscore_data': "teamwork collaborative learning proactive analytical communication technical client "
+                              "samenwerken team leren proactief analytisch communicatie technisch klant",
+    'prompt8_datatools': "excel vba power bi tableau qlik python sql azure databricks programming tools "
+                         "programmeren ervaring",
+    'prompt9_interests': "interests interest motivation data machine learning visualisation hobby "
+                         "interesse interesses motivatie waarom traineeship",
+}
+
+# Resume an interrupted run: reuse the newest results file made from the same inputs
+# and only run the prompts that are missing or invalid there. Prompts in force_prompts
+# are always regenerated: they skip resumed results and the response cache, and their
+# new answer replaces the cached one.
+resume_runs = False
+force_prompts = []
+
+# Stream responses instead of waiting for each full answer. Long-form prompts are
+# forwarded to the processing dialog as they arrive; list prompts stop reading
+# as soon as their closing bracket has been received.
+stream_responses = False
+streamed_prompts = ['prompt2_firstimpr', 'prompt3_personality']
+
+# Attempts per prompt for quota (429) and transient server errors; see rate_limit.py for the limits
+max_prompt_attempts = 3
+prompt_attempts = {
+    'prompt3_personality': 4,  # Longest section, most costly to lose
+}
+
+# Hedged requests: when a request has not answered within hedging.hedge_percentile of the
+# recent latencies of its prompt, one duplicate is sent and the first answer is kept.
+# Duplicates are capped at hedging.max_hedge_fraction of all requests. Latencies are
+# recorded even while hedging is off, so thresholds are ready when it is switched on.
+hedge_requests = False
+hedger = Hedger()
+
+# Optional ordering between prompts: a prompt listed here only starts once the
+# prompts it depends on have finished, and their outputs are added to its instructions.
+# Example: {'prompt6a_conqual': ['prompt3_personality']}
+prompt_dependencies = {}
+
+# Ask for all list-valued prompts in a single request with a JSON response schema
+# instead of one request per prompt. Fields that fail validation are re-asked one by one.
+structured_list_output = False
+STRUCTURED_TASK = 'structured_lists'
+
+# Answer prompts with deterministic local extractors (see extractors.py) where they are
+# confident enough, so those prompts never go to the model
+use_local_extractors = True
+
+# Self-consistency for score lists: one request returns several candidate answers and
+# every score is decided by vote over the valid candidates ('majority' or 'median').
+# The share of candidates agreeing with each final score is stored in the run summary.
+# Only fixed-length integer lists can be voted on; streaming is skipped for these prompts.
+self_consistency_prompts = []  # e.g. ['prompt7_qualscore', 'prompt7_qualscore_data']
+consistency_candidates = 5
+consistency_method = 'majority'
+
+# Item type and expected length (None = any length) of each list-valued prompt
+list_output_fields = {
+    'prompt4_cogcap_scores': ('INTEGER', 6),
+    'prompt5_language': ('STRING', 3),
+    'prompt6a_conqual': ('STRING', None),
+    'prompt6b_conimprov': ('STRING', None),
+    'prompt7_qualscore': ('INTEGER', 20),
+    'prompt7_qualscore_data': ('INTEGER', 23),
+    'prompt8_datatools': ('INTEGER', 5),
+    'prompt9_interests': ('STRING', None),
+}
 
 # --- REVISED PROMPTS ---
 prompts = {
@@ -244,48 +439,267 @@ Example: "['Machine Learning', 'Data Visualization']"
     ),
 }
 
-def send_prompts(data):
+def _build_context(file_contents, file_names):
+    return "\n\n---\n\n".join([f"File: {file_name}\nContent:\n{file_contents[file_name]}"
+                                  for file_name in file_names])
+
+def _routed_files(prompt_keys, file_contents, profile_name):
+    """Names of the loaded files that the given prompts need, in loading order."""
+    if not route_prompt_inputs:
+        return list(file_contents)
+    needed = set()
+    for key in prompt_keys:
+        if key not in prompt_inputs:
+            return list(file_contents)
+        needed.update(profile_name if name == PROFILE else name for name in prompt_inputs[key])
+    return [file_name for file_name in file_contents if file_name in needed]
+
+def _structured_prompt(prompt_keys):
+    """Combines the list-valued prompts into one instruction for a JSON response."""
+    tasks = "\n\n".join(f"### Task '{key}'\n{prompts[key]}" for key in prompt_keys)
+    return ("Complete each of the tasks below. Answer with one JSON object that has a field per task, "
+            "named after the task, holding the requested list itself (not a string).\n\n" + tasks)
+
+def _structured_schema(prompt_keys):
+    """JSON response schema with one typed array field per prompt."""
+    return {
+        "type": "OBJECT",
+        "properties": {key: {"type": "ARRAY", "items": {"type": list_output_fields[key][0]}}
+                       for key in prompt_keys},
+        "required": list(prompt_keys),
+    }
+
+def _valid_list_output(prompt_key, value):
+    """Checks a parsed list against the item type and length expected for the prompt."""
+    item_type, expected_length = list_output_fields[prompt_key]
+    if not isinstance(value, list) or not value:
+        return False
+    if expected_length is not None and len(value) != expected_length:
+        return False
+    if item_type == 'INTEGER':
+        return all(isinstance(item, int) and not isinstance(item, bool) for item in value)
+    return all(isinstance(item, str) and item.strip() for item in value)
+
+def _vote(candidates, method='majority'):
+    """
+    Element-wise vote over equally long integer lists. Returns the voted list and, per
+    item, the fraction of candidates that gave exactly that value. Majority ties go
+    to the lowest value; the median is rounded to the nearest integer.
+    """
+    votes = np.array(candidates)  # candidates x items
+    if method == 'median':
+        result = np.rint(np.median(votes, axis=0)).astype(int)
+    else:
+        values = np.unique(votes)
+        counts = (votes[None, :, :] == values[:, None, None]).sum(axis=1)  # values x items
+        result = values[counts.argmax(axis=0)]
+    agreement = (votes == result).mean(axis=0)
+    return [int(value) for value in result], [round(float(rate), 2) for rate in agreement]
+
+def _parse_structured_output(text, prompt_keys):
+    """
+    Returns the valid fields of a structured response as JSON list strings,
+    in the same format _extract_list_from_string produces.
+    """
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError as e:
+        print(f"Structured output is not valid JSON: {e}")
+        return {}
+    if not isinstance(parsed, dict):
+        return {}
+
+    outputs = {}
+    for key in prompt_keys:
+        if _valid_list_output(key, parsed.get(key)):
+            outputs[key] = json.dumps(parsed[key])
+        else:
+            print(f"Structured output for {key} is invalid: {parsed.get(key)}")
+    return outputs
+
+def _tier_model(task):
+    model = model_tiers[prompt_tiers.get(task, default_tier)].get('model') if use_model_tiers else None
+    return model or model_name
+
+def _tier_config(task):
+    """Generation parameters of the task's tier (everything except the model name)."""
+    if not use_model_tiers:
+        return {}
+    return {key: value for key, value in model_tiers[prompt_tiers.get(task, default_tier)].items() if key != 'model'}
+
+def _read_stream(chunks, prompt_key, list_output, deadline=None, cancel_token=None, stop_event=None):
+    """
+    Collects a streamed response, forwarding progress or stopping early for list output.
+    Setting stop_event (a hedged duplicate answered first) ends reading at the next chunk.
+    """
+    text = ""
+    for chunk in chunks:
+        check_cancelled(cancel_token)
+        if stop_event is not None and stop_event.is_set():
+            break
+        if deadline and time.time() > deadline:
+            raise TimeoutError(f"Streaming {prompt_key} exceeded its deadline")
+        text += chunk
+        if prompt_key in streamed_prompts:
+            global_signals.stream_text.emit(prompt_key, text)
+        elif list_output and re.search(r'\[[^\]]*\]', text):
+            break  # The complete list is in, the rest is only trailing text
+    return text
+
+def _valid_output(prompt_key, value):
+    """Whether a stored output can be reused when resuming a run."""
+    if not isinstance(value, str) or not value.strip():
+        return False
+    if prompt_key in list_output_fields:
+        try:
+            return _valid_list_output(prompt_key, json.loads(value))
+        except json.JSONDecodeError:
+            return False
+    return True
+
+def _inputs_fingerprint(model, program, prompt_keys, file_contents):
+    """Hash of everything that determines the outputs of a run."""
+    digest = hashlib.sha256()
+    for part in [model, program] + [prompts[key] for key in prompt_keys] + \
+                [f"{name}\n{content}" for name, content in sorted(file_contents.items())]:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def _write_json_atomic(path, data):
+    """Writes to a temporary file first, so a crash never leaves a half-written results file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as json_file:
+        json.dump(data, json_file, indent=4)
+    os.replace(tmp_path, path)
+
+def _find_checkpoint(fingerprint, directory='.'):
+    """Returns (path, results) of the newest results file with this fingerprint, or (None, {})."""
+    candidates = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.json') and entry.is_file():
+            candidates.append((entry.stat().st_mtime, os.path.normpath(entry.path)))
+    for _, path in sorted(candidates, reverse=True):
+        try:
+            with open(path, 'r') as json_file:
+                saved = json.load(json_file)
+        except (OSError, json.JSONDecodeError):
+            continue
+        if isinstance(saved, dict) and isinstance(saved.get('_run'), dict) and \
+                saved['_run'].get('fingerprint') == fingerprint:
+            return path, saved
+    return None, {}
+
+def schedule_prompts(prompt_keys, run_prompt, dependencies=None, max_workers=None, deadline=None,
+                     completed=None, on_result=None, cancel_token=None):
+    """
+    Runs run_prompt(prompt_key, previous_outputs) for every prompt on a bounded thread pool.
+    A prompt is submitted as soon as all its dependencies have finished (or are in `completed`);
+    prompts that have not finished when the deadline passes are skipped, and none is submitted
+    after it. on_result(prompt_key, output)
+    is called after each prompt. Returns a dict of prompt_key -> output, including `completed`.
+    Raises JobCancelled as soon as the cancel token fires, without waiting for running requests.
+    """
+    dependencies = dependencies or {}
+    pending = list(prompt_keys)
+    running = {}
+    results = dict(completed or {})
+    known = set(prompt_keys) | set(results)
+
+    executor = RequestPool(max_workers or max_concurrent_prompts)  # The application can exit mid-request
+    try:
+        while pending or running:
+            if deadline and time.time() >= deadline:
+                # Nothing is submitted once the deadline has passed
+                print("Timeout for all prompts reached.")
+                break
+            for prom in list(pending):
+                required = [dep for dep in dependencies.get(prom, []) if dep in known]
+                if all(dep in results for dep in required):
+                    pending.remove(prom)
+                    future = executor.submit(run_prompt, prom, {dep: results[dep] for dep in required})
+                    running[future] = prom
+
+            if not running:
+                print(f"Prompts with unresolvable dependencies skipped: {pending}")
+                break
+
+            # Wake up regularly to notice cancellation while requests are in flight
+            timeout = 0.5
+            if deadline:
+                timeout = max(0, min(timeout, deadline - time.time()))
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            check_cancelled(cancel_token)
+            if not done:
+                if deadline and time.time() >= deadline:
+                    print("Timeout for all prompts reached.")
+                    break
+                continue
+
+            for future in done:
+                prom = running.pop(future)
+                results[prom] = future.result()
+                if on_result:
+                    on_result(prom, results[prom])
+                finished = len([key for key in results if key in prompt_keys])
+                global_signals.update_message.emit(
+                    f"Finished prompt {finished}/{len(prompt_keys)}, please wait...")
+    finally:
+        # Don't block on requests that are still in flight after a timeout
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+def send_prompts(data, cancel_token=None, on_stage=None, input_folder='temp', output_folder='.', run_id=None):
+    """
+    Runs all prompts for one candidate and returns the path of the results JSON.
+    input_folder holds the redacted files written by redact_folder; the results JSON is
+    written to (and resumed from) output_folder, with run_id in its name when given.
+    on_stage('prompt') is called once the files are read and local extraction is done,
+    right before the first request is sent.
+    """
     print('Prompting started')
     global_signals.update_message.emit("Connecting to Gemini...")
 
-    # Gemini Pro API setup
-    GOOGLE_API_KEY = data["Gemini Key"]
-    genai.configure(api_key=GOOGLE_API_KEY)
-    model = genai.GenerativeModel(model_name="gemini-2.0-flash-001") # Or your preferred, compatible model.
+    # Model backend setup (clients are reused across runs). The default backend counts
+    # tokens; each task sends its requests to the backend of its tier's model.
+    api_key = openai_api_key if llm_backend == 'openai' else data["Gemini Key"]
+    backend = get_backend(llm_backend, api_key, model_name, openai_base_url)
+
+    def backend_for(task):
+        return get_backend(llm_backend, api_key, _tier_model(task), openai_base_url)
 
     # Filename setup
     current_time = datetime.now()
     formatted_time = current_time.strftime("%m%d%H%M")
     appl_name = data["Applicant Name"]
-    filename_with_timestamp = f"{appl_name}_{formatted_time}.json"
+    run_suffix = f"_{run_id}" if run_id else ""  # Keeps results of simultaneous jobs apart
+    filename_with_timestamp = os.path.join(output_folder, f"{appl_name}_{formatted_time}{run_suffix}.json")
 
-    # File paths
-    path_to_notes = r'temp/Assessment Notes.pdf'
-    path_to_persontest = r'temp/PAPI Feedback.pdf'
-    path_to_cogcap = r'temp/Cog. Test.pdf'
-    path_to_contextfile = r'resources/Context and Task Description.docx'
-    path_to_toneofvoice = r'resources/Examples Personality Section.docx'
-    path_to_mcpprofile = r'resources/The MCP Profile.docx'
-    path_to_dataprofile = r'resources/The Data Chiefs profile.docx'
+    # File paths (resource documents are defined at module level). Redacted files are named
+    # after their GUI field; the prompts refer to the PAPI report as PAPI Feedback.
+    path_to_notes = os.path.join(input_folder, 'Assessment Notes.pdf')
+    path_to_persontest = os.path.join(input_folder, 'PAPI Gebruikersrapport.pdf')
+    path_to_cogcap = os.path.join(input_folder, 'Cog. Test.pdf')
 
     lst_files = [
-        path_to_notes,
-        path_to_persontest,
-        path_to_cogcap,
-        path_to_contextfile,
-        path_to_toneofvoice,
+        (NOTES, path_to_notes),
+        (PAPI, path_to_persontest),
+        (COGTEST, path_to_cogcap),
+        (os.path.basename(path_to_contextfile), path_to_contextfile),
+        (os.path.basename(path_to_toneofvoice), path_to_toneofvoice),
     ]
 
     selected_program = data["Traineeship"]
     if selected_program == 'DATA':
-        lst_files.append(path_to_dataprofile)
+        path_to_profile = path_to_dataprofile
     else:
-        lst_files.append(path_to_mcpprofile)
+        path_to_profile = path_to_mcpprofile
+    lst_files.append((os.path.basename(path_to_profile), path_to_profile))
 
     # Pre-load file contents
     file_contents = {}
-    for file_path in lst_files:
-        file_name = os.path.basename(file_path)
+    for file_name, file_path in lst_files:
         if file_path.endswith('.pdf'):
             file_contents[file_name] = read_pdf(file_path)
         elif file_path.endswith('.docx'):
@@ -294,6 +708,7 @@ def send_prompts(data):
             print(f"Warning: Unsupported file type: {file_path}")
             file_contents[file_name] = ""
 
+    check_cancelled(cancel_token)
     global_signals.update_message.emit("Files uploaded, starting prompts...")
 
     # Determine which prompts to use based on program
@@ -321,41 +736,312 @@ def send_prompts(data):
         'prompt9_interests', 'prompt5_language'
     ]
 
+    # Resume from an earlier run with the same inputs, keeping its valid outputs
+    models = " ".join(sorted({_tier_model(prom) for prom in lst_prompts}))
+    fingerprint = _inputs_fingerprint(models, selected_program, lst_prompts, file_contents)
     results = {}
-    start_time_all = time.time()
+    if resume_runs:
+        checkpoint_path, saved = _find_checkpoint(fingerprint, output_folder)
+        if checkpoint_path:
+            results = {prom: saved[prom] for prom in lst_prompts
+                       if prom not in force_prompts and _valid_output(prom, saved.get(prom))}
+            filename_with_timestamp = checkpoint_path
+            print(f"Resuming {checkpoint_path}: {len(results)}/{len(lst_prompts)} prompts already complete")
+    resumed_prompts = list(results)
+
+    # Prompts a local extractor can answer reliably are not sent to the model
+    extraction_confidence = {}
+    if use_local_extractors:
+        local_extractors = {
+            'prompt4_cogcap_scores': lambda: extract_cogtest_scores(path_to_cogcap),
+            'prompt5_language': lambda: extract_language_levels(file_contents.get(NOTES, "")),
+        }
+        for prom, extract in local_extractors.items():
+            if prom not in lst_prompts or prom in results:
+                continue
+            value, confidence = extract()
+            extraction_confidence[prom] = round(confidence, 2)
+            if value is not None and confidence >= extractors.min_confidence:
+                results[prom] = json.dumps(value)
+                print(f"{prom} extracted locally: {results[prom]}")
+            else:
+                print(f"{prom}: local extraction not reliable (confidence {confidence:.2f}), asking the model")
+    extracted_prompts = [prom for prom in results if prom not in resumed_prompts]
+    remaining_prompts = [prom for prom in lst_prompts if prom not in results]
+
+    # In structured mode the list-valued prompts are replaced by a single request
+    structured_keys = []
+    scheduled_prompts = remaining_prompts
+    if structured_list_output:
+        structured_keys = [prom for prom in remaining_prompts if prom in list_output_fields]
+        if structured_keys:
+            scheduled_prompts = [prom for prom in remaining_prompts if prom not in structured_keys] + [STRUCTURED_TASK]
+    task_prompts = {prom: [prom] for prom in lst_prompts}
+    task_prompts[STRUCTURED_TASK] = structured_keys
+
+    # Every task only gets the files it needs, and only the relevant chunks of long
+    # documents. Tasks with identical contexts share one, registered with the context cache once.
+    profile_name = os.path.basename(path_to_profile)
+    task_files = {task: _routed_files(keys, file_contents, profile_name)
+                  for task, keys in task_prompts.items()}
+
+    indexes = {}
+    if use_retrieval:
+        for file_name in retrieval_files:
+            if estimate_tokens(file_contents.get(file_name, "")) > retrieval_token_budget:
+                indexes[file_name] = BM25Index(chunk_text(file_contents[file_name]))
+                print(f"Using top-ranked chunks of {file_name}")
+
+    def task_texts(task):
+        # Retrieval only when every prompt of the task has focused search terms
+        keys = task_prompts[task]
+        query = " ".join(retrieval_queries[key] for key in keys) if all(key in retrieval_queries for key in keys) else None
+        texts = {}
+        for file_name in task_files[task]:
+            if file_name in indexes and query:
+                texts[file_name] = indexes[file_name].select(query, retrieval_token_budget)
+            else:
+                texts[file_name] = file_contents[file_name]
+        return texts
+
+    # Pre-flight: measure every context against its budget and trim or warn before sending
+    file_tokens = {file_name: token_budget.count_tokens(content, backend)
+                   for file_name, content in file_contents.items()}
+    task_contexts = {}
+    tokens_per_prompt = {}
+    over_budget = []
+    full_context_tokens = sum(file_tokens.values())
+    for task in task_prompts:
+        texts = task_texts(task)
+        instructions = "\n".join(prompts[key] for key in task_prompts[task])
+        budget = max(token_budget.budget_for(key) for key in task_prompts[task] or [task])
+        routed_tokens = estimate_tokens(_build_context(texts, texts))
+        if token_budget.auto_trim_context:
+            texts = token_budget.trim_texts(texts, budget, estimate_tokens(instructions))
+        task_contexts[task] = _build_context(texts, texts)
+
+        if task in scheduled_prompts:
+            sent_tokens = token_budget.count_tokens(f"{instructions}\n\n{task_contexts[task]}", backend)
+            tokens_per_prompt[task] = {'all_files': full_context_tokens, 'routed': routed_tokens,
+                                       'sent': sent_tokens, 'budget': budget}
+            if sent_tokens > budget:
+                print(f"Warning: {task} needs about {sent_tokens} tokens, budget is {budget}")
+                over_budget.append(task)
+
+    # Cached contexts belong to one model, so tasks share a context only within a tier model
+    cache = {'provider': ProviderContextCache, 'local': LocalContextCache}.get(context_cache_backend)
+    context_users = {}
+    for task in scheduled_prompts:
+        key = (_tier_model(task), task_contexts[task])
+        context_users[key] = context_users.get(key, 0) + 1
+    contexts = {}
+    contexts_lock = threading.Lock()  # Guards the dicts only, never held while a context is created
+    context_locks = {}
+    contexts_closed = threading.Event()  # Set when the run closes its contexts; later ones are not cached
+
+    def context_for(task):
+        task_backend = backend_for(task)
+        key = (_tier_model(task), task_contexts[task])
+        with contexts_lock:
+            if key in contexts:
+                return contexts[key]
+            key_lock = context_locks.setdefault(key, threading.Lock())
+        with key_lock:  # Other tasks with this context wait for its creation, nobody else does
+            if key not in contexts:
+                worth_caching = context_users.get(key, 0) >= 2 and not contexts_closed.is_set() and (
+                    context_cache_backend != 'provider' or
+                    estimate_tokens(task_contexts[task]) >= min_cached_context_tokens)
+                shared_context = SharedContext(task_backend, task_contexts[task],
+                                               cache(task_backend) if cache and worth_caching else None)
+                with contexts_lock:
+                    contexts[key] = shared_context
+                    closed = contexts_closed.is_set()
+                if closed:
+                    # A request still in flight after the run timed out: don't leave a cache behind
+                    shared_context.close()
+            return contexts[key]
+
+    responses = ResponseCache(enabled=use_response_cache)
+    attempts = {}
+    hedged = {}  # Duplicate requests sent per task
+    agreement = {}  # Per-item agreement of voted score lists
+
+    def generate_text(task, prompt_text, stream=False, generation_config=None, **kwargs):
+        """Sends one request through the shared rate limiter, retrying only this task on failure."""
+        shared_context = context_for(task)
+        generation_config = {**_tier_config(task), **(generation_config or {})}
+        if generation_config:
+            kwargs['generation_config'] = generation_config
+
+        tokens = estimate_tokens(shared_context.context) + estimate_tokens(prompt_text)
+
+        def attempt():
+            attempts[task] = attempts.get(task, 0) + 1
+            # Per-attempt deadline, never beyond the deadline of the whole run
+            timeout = max(1, min(prompt_timeouts.get(task, prompt_timeout), deadline - time.time()))
+
+            def request(stop_event):
+                if stream:
+                    chunks = shared_context.generate(prompt_text, stream=True, timeout=timeout, **kwargs)
+                    return _read_stream(chunks, task, task in list_output_prompts,
+                                        time.time() + timeout, cancel_token, stop_event)
+                return shared_context.generate(prompt_text, timeout=timeout, **kwargs)
+
+            def before_hedge():
+                hedged[task] = hedged.get(task, 0) + 1
+                shared_limiter.acquire(tokens)
+            return hedger.run(task, request, hedge_requests, before_hedge)
+        return call_with_retry(attempt, prompt_attempts.get(task, max_prompt_attempts), shared_limiter,
+                               tokens, deadline, cancel_token)
+
+    def run_structured(prompt_keys):
+        prompt_text = _structured_prompt(prompt_keys)
+        generation_config = {
+            "response_mime_type": "application/json",
+            "response_schema": _structured_schema(prompt_keys),
+        }
+        # Keyed on the context text: the shared context is only created on a cache miss
+        cache_key = response_key(_tier_model(STRUCTURED_TASK), STRUCTURED_TASK, prompt_text,
+                                 task_contexts[STRUCTURED_TASK],
+                                 **{**_tier_config(STRUCTURED_TASK), **generation_config})
+        forced = any(key in force_prompts for key in prompt_keys)
+        cached = None if forced else responses.get(cache_key)
+        if cached is not None:
+            print(f"Using cached response for {STRUCTURED_TASK}")
+            return cached
 
-    for promno, prom in enumerate(lst_prompts, start=1):
+        try:
+            output_text = generate_text(STRUCTURED_TASK, prompt_text, generation_config=generation_config)
+            print(f"Raw Output: {output_text}")
+            outputs = _parse_structured_output(output_text, prompt_keys)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            print(f"Error processing structured prompts: {e}")
+            return {}
+
+        if outputs:  # Invalid fields are left out and re-asked separately
+            responses.put(cache_key, outputs)
+        return outputs
+
+    def run_voted(prom, prompt_text):
+        candidate_texts = generate_text(prom, prompt_text,
+                                        generation_config={'candidate_count': consistency_candidates})
+        print(f"Raw Output ({len(candidate_texts)} candidates): {candidate_texts}")
+        candidates = []
+        for text in candidate_texts:
+            parsed = json.loads(_extract_list_from_string(text))
+            if _valid_list_output(prom, parsed):
+                candidates.append(parsed)
+        if not candidates:
+            return '[]'
+        voted, agreement[prom] = _vote(candidates, consistency_method)
+        print(f"{prom}: voted over {len(candidates)} valid candidates, agreement {agreement[prom]}")
+        return json.dumps(voted)
+
+    def run_prompt(prom, previous_outputs):
         print(prom)
-        global_signals.update_message.emit(f"Submitting prompt {promno}/{len(lst_prompts)}, please wait...")
-
+        if prom == STRUCTURED_TASK:
+            return run_structured(structured_keys)
+        voted = prom in self_consistency_prompts and list_output_fields.get(prom, (None, None))[0] == 'INTEGER' \
+            and list_output_fields[prom][1] is not None
         prompt_text = prompts[prom]
-        context = "\n\n---\n\n".join([f"File: {file_name}\nContent:\n{content}"
-                                        for file_name, content in file_contents.items()])
-        full_prompt = f"{prompt_text}\n\nUse the following files to complete the tasks. Do not give any output for this prompt.\n{context}"
+        if previous_outputs:
+            prompt_text += "\n\nOutputs of the previous prompts:\n" + "\n\n".join(
+                f"{key}:\n{output}" for key, output in previous_outputs.items())
+
+        settings = dict(_tier_config(prom))
+        if voted:
+            settings.update(candidate_count=consistency_candidates, vote=consistency_method)
+        cache_key = response_key(_tier_model(prom), prom, prompt_text, task_contexts[prom], **settings)
+        cached = None if prom in force_prompts else responses.get(cache_key)
+        if cached is not None:
+            print(f"Using cached response for {prom}")
+            return cached
 
         try:
-            response = model.generate_content(full_prompt)
-            output_text = response.text
-            print(f"Prompt: {prom}")
-            print(f"Raw Output: {output_text}")
-
-            # --- Crucial Post-Processing ---
-            if prom in list_output_prompts:
-                results[prom] = _extract_list_from_string(output_text)
+            if voted:
+                output = run_voted(prom, prompt_text)
             else:
-                results[prom] = output_text.strip()
-
+                output_text = generate_text(prom, prompt_text, stream=stream_responses)
+                print(f"Prompt: {prom}")
+                print(f"Raw Output: {output_text}")
+
+                # --- Crucial Post-Processing ---
+                if prom in list_output_prompts:
+                    output = _extract_list_from_string(output_text)
+                else:
+                    output = output_text.strip()
+
+        except JobCancelled:
+            raise
         except Exception as e:
             print(f"Error processing prompt {prom}: {e}")
-            results[prom] = ""  # Store empty string on error
+            return ""  # Store empty string on error
 
-        if time.time() - start_time_all > max_wait_time:
-            print("Timeout for all prompts reached.")
-            break
+        if output and output != '[]':  # Never cache failed or empty answers
+            responses.put(cache_key, output)
+        return output
+
+    def ordered(outputs):
+        # Keep the original prompt order in the JSON output
+        return {prom: outputs[prom] for prom in lst_prompts if prom in outputs}
+
+    checkpoint = dict(results)
+
+    def save_checkpoint(prom, output):
+        # Written after every prompt, so an interrupted run can be resumed
+        if prom == STRUCTURED_TASK:
+            checkpoint.update(output)
+        else:
+            checkpoint[prom] = output
+        _write_json_atomic(filename_with_timestamp,
+                           {**ordered(checkpoint), '_run': {'fingerprint': fingerprint, 'complete': False}})
+
+    if on_stage:
+        on_stage('prompt')
+    global_signals.update_message.emit(f"Submitting {len(scheduled_prompts)} prompts, please wait...")
+    start_time_all = time.time()
+    deadline = start_time_all + max_wait_time
+    try:
+        results = schedule_prompts(scheduled_prompts, run_prompt, prompt_dependencies,
+                                   max_concurrent_prompts, deadline, results, save_checkpoint, cancel_token)
+        results.update(results.pop(STRUCTURED_TASK, {}))
+
+        # Re-ask fields the structured response did not answer correctly
+        missing = [prom for prom in structured_keys if prom not in results]
+        if missing and time.time() < deadline:
+            print(f"Falling back to separate prompts for: {missing}")
+            results = schedule_prompts(missing, run_prompt, prompt_dependencies,
+                                       max_concurrent_prompts, deadline, results, save_checkpoint, cancel_token)
+    finally:
+        with contexts_lock:
+            contexts_closed.set()
+            shared_contexts = list(contexts.values())
+        for shared_context in shared_contexts:
+            shared_context.close()
+    results = ordered(results)
+
+    # Run summary, stored next to the outputs
+    results['_run'] = {
+        'fingerprint': fingerprint,
+        'complete': all(_valid_output(prom, results.get(prom)) for prom in lst_prompts),
+        'resumed_prompts': resumed_prompts,
+        'extracted_prompts': extracted_prompts,
+        'extraction_confidence': extraction_confidence,
+        'duration_seconds': round(time.time() - start_time_all, 1),
+        'models': {task: _tier_model(task) for task in scheduled_prompts},
+        'attempts': attempts,
+        'agreement': agreement,
+        'hedged_requests': hedged,
+        'file_tokens': file_tokens,
+        'tokens_per_prompt': tokens_per_prompt,
+        'over_budget': over_budget,
+        'failed_prompts': [prom for prom in lst_prompts if not results.get(prom)],
+    }
 
     # Save results to JSON
-    with open(filename_with_timestamp, 'w') as json_file:
-        json.dump(results, json_file, indent=4)
+    _write_json_atomic(filename_with_timestamp, results)
 
     global_signals.update_message.emit("Prompting finished, generating report...")
     return filename_with_timestamp
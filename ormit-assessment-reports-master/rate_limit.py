@@ -0,0 +1,133 @@
+import random
+import re
+import threading
+import time
+from cancellation import check_cancelled
+
+requests_per_minute = 60
+tokens_per_minute = 1_000_000
+base_retry_delay = 2  # Seconds before the first retry, doubled on each further attempt
+max_retry_delay = 60
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate_per_minute."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """Blocks until `amount` tokens are available and takes them."""
+        amount = min(amount, self.capacity)  # A single huge request must still be able to pass
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait_time = (amount - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+class RateLimiter:
+    """
+    Shared request and token budget for all model calls in this process.
+    A quota error pauses every caller, not just the one that received it.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.set_limits(requests_per_minute, tokens_per_minute)
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def set_limits(self, requests_per_minute, tokens_per_minute):
+        """Replaces the budgets, e.g. from the command line; the limiter object itself stays shared."""
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens=0):
+        while True:
+            with self.lock:
+                wait_time = self.paused_until - time.monotonic()
+            if wait_time <= 0:
+                break
+            time.sleep(wait_time)
+        self.requests.acquire(1)
+        if tokens:
+            self.tokens.acquire(tokens)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+shared_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+def _status_code(exc):
+    code = getattr(exc, 'code', None)  # google.api_core errors carry the HTTP status here
+    if isinstance(code, int):
+        return code
+    response = getattr(exc, 'response', None)
+    return getattr(response, 'status_code', None)
+
+def is_retryable(exc):
+    """Quota errors, transient server errors and dropped connections or timeouts are worth retrying."""
+    status = _status_code(exc)
+    if status is None:
+        # Network-level failures: builtin ConnectionError/TimeoutError and the requests exceptions
+        return isinstance(exc, OSError)
+    return status in RETRYABLE_STATUS_CODES
+
+def retry_after_seconds(exc):
+    """Returns the server-requested delay in seconds, or None if it did not ask for one."""
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        pass
+
+    for detail in getattr(exc, 'details', None) or []:
+        delay = getattr(detail, 'retry_delay', None)  # google.rpc.RetryInfo
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+
+    match = re.search(r'retry in (\d+(?:\.\d+)?)\s*s', str(exc), re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+def call_with_retry(fn, max_attempts, limiter=None, tokens=0, deadline=None, cancel_token=None):
+    """
+    Calls fn() until it succeeds or max_attempts is used up, waiting for the rate limiter
+    before every attempt. Retryable errors back off exponentially with jitter, or for as long
+    as the server asked; other errors are raised straight away. No retry is started when
+    its backoff would end after `deadline` (a time.time() value) or the job was cancelled.
+    """
+    limiter = limiter or shared_limiter
+    for attempt in range(1, max_attempts + 1):
+        check_cancelled(cancel_token)
+        limiter.acquire(tokens)
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_attempts or not is_retryable(e):
+                raise
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = min(max_retry_delay, base_retry_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            if deadline and time.time() + delay > deadline:
+                raise
+            if _status_code(e) == 429:
+                limiter.pause(delay)
+            print(f"Attempt {attempt}/{max_attempts} failed ({e}), retrying in {delay:.1f}s")
+            if cancel_token is not None:
+                cancel_token.wait(delay)
+            else:
+                time.sleep(delay)
@@ -2,6 +2,122 @@ import fitz
 import re
 import os
 import shutil
+from collections import Counter, defaultdict
+from cancellation import check_cancelled
+
+use_word_index = True  # Find redaction areas in a word index of the page instead of one page.search_for per hit
+
+# Keywords whose following line is redacted as a whole (e.g. the line after "Address")
+KEYWORDS = ["gender", "address", "phone", "e-mail", "date of birth", "links", "socials"]
+EMAIL_REG = r'[\w\.-]+@[\w\.-]+'
+# Phone numbers with a country code, like +32 496 61 73 89 or +31 6 1234 5678. Spaces only,
+# since the matcher scans the whole page text and a number never continues on the next line.
+PHONE_REG = r'\+\d{1,3}[^\S\n]*\d{1,3}(?:[^\S\n]*\d{2,3}){2,4}'
+
+class SensitiveDataMatcher:
+    """
+    Finds the same sensitive data as Redactor.get_sensitive_data (names, e-mail addresses,
+    phone numbers and the lines after a keyword line) in one scan of the page text.
+    Build it once per applicant; the pattern is compiled in the constructor.
+    """
+
+    def __init__(self, target_names):
+        names = '|'.join(re.escape(name) for name in target_names)
+        # The keyword alternative is a lookahead, so names on the keyword line and the line
+        # after it are still found. E-mails go before names, so a name inside an address
+        # does not cut the address short.
+        self.pattern = re.compile(
+            r'^(?=(?i:' + '|'.join(re.escape(keyword) for keyword in KEYWORDS) + r')[^\n]*\n(?P<line>[^\n]*))'
+            r'|(?P<email>' + EMAIL_REG + r')'
+            r'|(?P<phone>' + PHONE_REG + r')'
+            r'|(?P<name>(?i:\b(?:' + names + r')\b))',
+            re.MULTILINE)
+
+    def find(self, text):
+        """Returns the distinct sensitive strings in text, in the order they are found."""
+        hits = {}
+        for match in self.pattern.finditer(text):
+            hit = match.group(match.lastgroup)
+            if hit.strip():
+                hits[hit] = None
+        return list(hits)
+
+class PageWordIndex:
+    """
+    Index of the words on one page (page.get_text("words")) by lower-cased word, built once
+    per page. find() returns the areas of a word or phrase from the index, so a page is not
+    searched again for every hit. Only whole words match: "Marc" is not found in "Marc's".
+    Pass the page's textpage when there is one, so the page text is not extracted again.
+    """
+
+    def __init__(self, page, textpage=None):
+        self.words = page.get_text("words", textpage=textpage)  # (x0, y0, x1, y1, word, block, line, word number)
+        self.tokens = [word[4].lower() for word in self.words]
+        self.positions = defaultdict(list)
+        lines = defaultdict(list)
+        for i, token in enumerate(self.tokens):
+            self.positions[token].append(i)
+            lines[self.words[i][5:7]].append(token)
+        # Text line of every word, as in get_text("text") with the spacing normalised
+        self.line_of = [" ".join(lines[word[5:7]]) for word in self.words]
+
+    def starts(self, phrase):
+        """Indexes of the first word of every occurrence of phrase."""
+        tokens = phrase.lower().split()
+        if not tokens:
+            return []
+        return [start for start in self.positions.get(tokens[0], [])
+                if self.tokens[start + 1:start + len(tokens)] == tokens[1:]]
+
+    def line_counts(self, phrase):
+        """Occurrences of phrase by the (lower-cased) text line they start on."""
+        return Counter(self.line_of[start] for start in self.starts(phrase))
+
+    def find(self, phrase):
+        """Returns one list of areas (one per text line) for every occurrence of phrase."""
+        occurrences = []
+        for start in self.starts(phrase):
+            lines = {}
+            for word in self.words[start:start + len(phrase.split())]:
+                key = (word[5], word[6])
+                rect = fitz.Rect(word[:4])
+                lines[key] = lines[key] | rect if key in lines else rect
+            occurrences.append(list(lines.values()))
+        return occurrences
+
+def redaction_areas(page, text, sensitive, textpage=None):
+    """
+    Areas to redact for the sensitive strings found in text (the page's get_text("text")).
+    The word index answers most strings; when it finds fewer occurrences than the page text
+    holds on any line (e.g. "Kampen's" or "tel:+32 ..."), page.search_for is used for that
+    string, which covers only the matching characters. Lines are compared one by one, since
+    the index also matches phrases across a line break, which would hide a miss in a total.
+    textpage is the page's extracted text, shared by the index and the searches.
+    Returns {string: areas}; an area covered by an earlier string is not repeated.
+    """
+    if not sensitive:
+        return {}
+    textpage = textpage or page.get_textpage()
+    index = PageWordIndex(page, textpage)
+    lines = [" ".join(line.split()) for line in text.lower().split('\n')]
+    seen = set()
+    areas = {}
+    for data in sensitive:
+        pattern = re.compile(r'(?<!\w)' + re.escape(" ".join(data.lower().split())) + r'(?!\w)')
+        expected = Counter()
+        for line in lines:
+            expected[line] += len(pattern.findall(line))
+        indexed = index.line_counts(data)
+        if any(indexed[line] < count for line, count in expected.items()):
+            found = page.search_for(data, textpage=textpage)
+        else:
+            found = [rect for occurrence in index.find(data) for rect in occurrence]
+        areas[data] = []
+        for rect in found:
+            if tuple(rect) not in seen:
+                seen.add(tuple(rect))
+                areas[data].append(rect)
+    return areas
 
 class Redactor:
     # static methods work independent of class object
@@ -42,12 +158,13 @@ class Redactor:
                 yield match.group(0)  # yield matched phone number
 
     # constructor
-    def __init__(self, path, target_names, new_filename, profile_pic):
+    def __init__(self, path, target_names, new_filename, profile_pic, matcher=None):
         self.path = path
         self.target_names = target_names
         self.profile_pic = profile_pic
+        self.matcher = matcher or SensitiveDataMatcher(target_names)
 
-    def redaction(self, new_filename):
+    def redaction(self, new_filename, cancel_token=None, output_folder='temp'):
         """ main redactor code """
 
         # opening the pdf
@@ -59,17 +176,21 @@ class Redactor:
         
         # iterating through pages
         for i, page in enumerate(doc):
+            check_cancelled(cancel_token)  # Stop between pages when the job is cancelled
             if self.profile_pic and i == 0:
                 print(f"Redacting profile picture on page {i + 1}")  # Debugging message
                 page.add_redact_annot(profile_pic_rect, fill=(0, 0, 0))  # Redact the profile picture area
             
-            # Get text from the page
-            text = page.get_text("text").split('\n')  # Updated to get_text()
+            # Get text from the page, extracted once for the matcher, the word index and searches
+            textpage = page.get_textpage()
+            text = page.get_text("text", textpage=textpage)
             # getting the rect boxes which consists the matching names, email, and phone regex
-            sensitive = self.get_sensitive_data(text, self.target_names)
+            sensitive = self.matcher.find(text)
+            if use_word_index:
+                page_areas = redaction_areas(page, text, sensitive, textpage)
             for data in sensitive:
                 print(f"Sensitive data found: {data}")  # Debugging line
-                areas = page.search_for(data)
+                areas = page_areas[data] if use_word_index else page.search_for(data, textpage=textpage)
                 print(f"Redaction areas for '{data}': {areas}")  # Debugging line
 
                 # drawing outline over sensitive data
@@ -79,29 +200,29 @@ class Redactor:
             page.apply_redactions()
 
         # saving it to a new pdf
-        output_path = os.path.join('temp', f"{new_filename}.pdf")  # Update to save in temp folder
+        output_path = os.path.join(output_folder, f"{new_filename}.pdf")
         doc.save(output_path)
         
         print(f"Successfully redacted {self.path} to {output_path}")
 
-def create_temp_folder():
-    # Define the temporary folder path
-    temp_folder = 'temp'
+def create_temp_folder(temp_folder='temp'):
     # Create the temp directory if it doesn't exist
     if not os.path.exists(temp_folder):
         os.makedirs(temp_folder)
             
 # driver code for testing
-def redact_folder(data, profile_pic=False):
-    create_temp_folder() #Create Temp
+def redact_folder(data, profile_pic=False, cancel_token=None, output_folder='temp'):
+    """Writes a redacted copy of each file in data["Files"] to output_folder, named after its key."""
+    create_temp_folder(output_folder) #Create Temp
     full_name_split = data["Applicant Name"].split()  # Split the name by spaces
     target_names = [full_name_split[0], full_name_split[-1]] #In case of name with more than 2 parts, keep first and last for redaction
     print(target_names)
+    matcher = SensitiveDataMatcher(target_names)  # Shared by all files of this applicant
     for new_filename, filename in data["Files"].items():
         path = os.path.join('temp', filename)  # Construct the path to the file
         if new_filename == "Assessment Notes":
             profile_pic=True
         else:
             profile_pic=False
-        redactor = Redactor(path, target_names, new_filename, profile_pic)  # Create a Redactor instance
-        redactor.redaction(new_filename)  # Perform redaction
\ No newline at end of file
+        redactor = Redactor(path, target_names, new_filename, profile_pic, matcher)  # Create a Redactor instance
+        redactor.redaction(new_filename, cancel_token, output_folder)  # Perform redaction
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""
+Headless entry point: redact, prompt and render reports without the GUI (and without Qt).
+
+One candidate:
+    python -m report_cli --name "Jan Peeters" --assessor "An Smet" --gender M --traineeship MCP
+                         --papi papi.pdf --cogtest cog.pdf --notes notes.pdf
+A cohort, from a CSV (header row) or JSON (list of objects) manifest with the fields
+name, assessor, gender, traineeship, papi, cogtest, notes:
+    python -m report_cli --manifest cohort.csv --parallel 2 --rpm 30
+
+The Gemini key is read from --key or the GEMINI_API_KEY environment variable.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_FIELDS = ['name', 'assessor', 'gender', 'traineeship', 'papi', 'cogtest', 'notes']
+
+def candidate_data(candidate, api_key):
+    """Turns a manifest entry into the GUI_data dictionary the pipeline expects."""
+    missing = [field for field in MANIFEST_FIELDS if not candidate.get(field)]
+    if missing:
+        raise ValueError(f"Candidate {candidate.get('name', '?')} is missing: {', '.join(missing)}")
+    return {
+        "Gemini Key": api_key,
+        "Applicant Name": candidate['name'],
+        "Assessor Name": candidate['assessor'],
+        "Gender": candidate['gender'].upper(),
+        "Traineeship": candidate['traineeship'].upper(),
+        "Files": {
+            "PAPI Gebruikersrapport": os.path.abspath(candidate['papi']),
+            "Cog. Test": os.path.abspath(candidate['cogtest']),
+            "Assessment Notes": os.path.abspath(candidate['notes']),
+        },
+    }
+
+def read_manifest(path):
+    if path.lower().endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return [{key.strip().lower(): (value or "").strip() for key, value in row.items()}
+                for row in csv.DictReader(f)]
+
+def process(GUI_data, output_folder='.'):
+    from pipeline import run_pipeline
+    from cancellation import JobCancelled
+    start = time.time()
+    row = {'name': GUI_data["Applicant Name"], 'status': 'ok', 'redact': None, 'prompt': None,
+           'render': None, 'report': None}
+    try:
+        outcome = run_pipeline(GUI_data, output_folder=output_folder)
+        row.update(outcome['timings'])
+        row['report'] = outcome['report']
+        if not outcome['report']:
+            row['status'] = 'failed'
+    except JobCancelled:
+        row['status'] = 'cancelled'
+    except Exception as e:
+        print(f"Error processing {GUI_data['Applicant Name']}: {e}")
+        row['status'] = 'failed'
+    row['total'] = round(time.time() - start, 2)
+    return row
+
+def print_summary(rows, wall_time):
+    columns = ['name', 'status', 'redact', 'prompt', 'render', 'total', 'report']
+    table = [[str(row.get(column) if row.get(column) is not None else '-') for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in table)) for i, column in enumerate(columns)]
+    print()
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    print("  ".join("-" * width for width in widths))
+    for line in table:
+        print("  ".join(value.ljust(width) for value, width in zip(line, widths)))
+    succeeded = sum(row['status'] == 'ok' for row in rows)
+    print(f"\n{succeeded}/{len(rows)} reports written in {wall_time:.1f}s")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='report_cli', description="Draft assessment reports without the GUI.")
+    parser.add_argument('--manifest', help="CSV or JSON file with one candidate per row")
+    parser.add_argument('--name', help="Applicant full name")
+    parser.add_argument('--assessor', help="Assessor full name")
+    parser.add_argument('--gender', choices=['M', 'F', 'm', 'f'])
+    parser.add_argument('--traineeship', choices=['MCP', 'DATA', 'mcp', 'data'])
+    parser.add_argument('--papi', help="PAPI Gebruikersrapport PDF")
+    parser.add_argument('--cogtest', help="Cog. Test PDF")
+    parser.add_argument('--notes', help="Assessment Notes PDF")
+    parser.add_argument('--key', default=os.environ.get('GEMINI_API_KEY', ''), help="Gemini API key")
+    parser.add_argument('--output', default='.', help="Folder for the reports and results files")
+    parser.add_argument('--parallel', type=int, default=1, help="Candidates processed at the same time")
+    parser.add_argument('--rpm', type=int, help="Model requests per minute, shared by all candidates")
+    parser.add_argument('--tpm', type=int, help="Model tokens per minute, shared by all candidates")
+    parser.add_argument('--backend', choices=['gemini', 'openai', 'fake'], help="Model backend (see prompting.py)")
+    parser.add_argument('--model', help="Default model name")
+    parser.add_argument('--verbose', action='store_true', help="Print pipeline status messages")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.manifest:
+        candidates = read_manifest(args.manifest)
+    else:
+        candidates = [{field: getattr(args, field) for field in MANIFEST_FIELDS}]
+    try:
+        jobs = [candidate_data(candidate, args.key) for candidate in candidates]
+    except ValueError as e:
+        print(e)
+        return 2
+
+    # Heavy modules are only imported once the arguments are known to be valid
+    import prompting
+    import rate_limit
+    from global_signals import global_signals
+    if args.backend:
+        prompting.llm_backend = args.backend
+    if args.model:
+        prompting.model_name = args.model
+    if args.rpm or args.tpm:
+        rate_limit.shared_limiter.set_limits(args.rpm or rate_limit.requests_per_minute,
+                                             args.tpm or rate_limit.tokens_per_minute)
+    if args.verbose:
+        global_signals.update_message.connect(print)
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as executor:
+        rows = list(executor.map(process, jobs, [args.output] * len(jobs)))
+    print_summary(rows, time.time() - start)
+    return 0 if all(row['status'] == 'ok' for row in rows) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,333 @@
+"""
+Local report service: keeps the pipeline modules, templates, resource texts and model
+clients loaded, and runs report jobs on a pool of worker threads.
+
+    python -m report_service --port 8765 --workers 4
+
+Job API (JSON). A job payload is the GUI_data dictionary of the GUI form; file paths
+must be readable by the service, which runs on the same machine.
+    POST   /jobs?priority=N    submit a job        -> 202 {"id": ..., "status": "queued"}
+    GET    /jobs               all known jobs
+    GET    /jobs/<id>          status, stage, timings and error of one job
+    GET    /jobs/<id>/result   the report (.docx) of a finished job
+    DELETE /jobs/<id>          cancel a queued or running job
+Higher priorities run first. Jobs are kept in a SQLite queue (job_queue.py), so jobs
+that were queued or running when the service stopped continue after a restart.
+The Gemini key of a job is only kept in memory, not in the queue: jobs resumed after a
+restart use the key the service was started with (--key or GEMINI_API_KEY), and payloads
+may leave the key out when the service has one. The service only listens on localhost,
+since payloads carry the Gemini key. Requests from web pages (with an Origin header) are
+refused and jobs must be posted as application/json, so a page open in a browser cannot
+submit jobs that read local files: a cross-origin JSON POST needs a preflight, which the
+service does not answer.
+"""
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from cancellation import CancelToken, JobCancelled
+from job_queue import JobQueue
+
+default_host = '127.0.0.1'
+default_port = 8765
+default_workers = 4
+
+REQUIRED_FIELDS = ["Gemini Key", "Applicant Name", "Assessor Name", "Gender", "Traineeship", "Files"]
+REQUIRED_FILES = ["PAPI Gebruikersrapport", "Cog. Test", "Assessment Notes"]
+DOCX_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+def validate_job(GUI_data, key_required=True):
+    """Returns an error message for an unusable payload, or None."""
+    if not isinstance(GUI_data, dict):
+        return "Payload must be a JSON object"
+    missing = [field for field in REQUIRED_FIELDS
+               if not GUI_data.get(field) and (key_required or field != "Gemini Key")]
+    files = GUI_data.get("Files")
+    if isinstance(files, dict):
+        missing += [f"Files/{name}" for name in REQUIRED_FILES if not files.get(name)]
+    elif files:
+        missing.append("Files")
+    return f"Missing fields: {', '.join(missing)}" if missing else None
+
+STAGE_DONE = {'redact': 'redacted', 'extract': 'extracted', 'prompt': 'prompted', 'render': 'rendered'}
+
+def job_summary(job, current_stage=None):
+    # Never echo the payload: it contains the API key
+    return {
+        'id': job['id'],
+        'applicant': job['payload'].get("Applicant Name"),
+        'priority': job['priority'],
+        'status': job['status'],
+        'stage': current_stage,  # Stage in progress, for running jobs
+        'completed_stage': job['stage'],
+        'attempts': job['attempts'],
+        'report': os.path.basename(job['artifacts']['report']) if job['artifacts'].get('report') else None,
+        'error': job['error'],
+        'timings': job['timings'],
+        'submitted': job['submitted'],
+        'started': job['started'],
+        'finished': job['finished'],
+    }
+
+class JobManager:
+    """
+    Runs jobs from the persistent queue (job_queue.py) on worker threads. Leases of running
+    jobs are renewed in the background; jobs left running by a previous service process are
+    queued again at start-up, and a job that already has its prompt results only renders again.
+    The queue does not store the Gemini key: keys of submitted jobs are kept here, and api_key
+    is used for jobs without one (resumed after a restart, or enqueued by the folder watcher).
+    """
+
+    def __init__(self, workers=None, queue=None, api_key=None):
+        self.queue = queue or JobQueue()
+        self.api_key = api_key
+        self.keys = {}  # Job id -> Gemini key of the submitted payload
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}:"
+        requeued = self.queue.requeue_interrupted()  # One service per queue file
+        if requeued:
+            print(f"Resuming {requeued} interrupted jobs")
+        self.running = {}  # Job id -> (worker id, cancel token, current stage)
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.new_job = threading.Event()
+        self.threads = [threading.Thread(target=self._worker, args=(f"{self.worker_prefix}{n}",),
+                                         name=f'report-job-{n}', daemon=True)
+                        for n in range(workers or default_workers)]
+        self.threads.append(threading.Thread(target=self._renew_leases, name='job-leases', daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, GUI_data, priority=0):
+        # Under the lock the workers look keys up with, so no worker claims the job before its key is kept
+        with self.lock:
+            job_id = self.queue.enqueue(GUI_data, priority)
+            if GUI_data.get("Gemini Key"):
+                self.keys[job_id] = GUI_data["Gemini Key"]
+        self.new_job.set()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        job = self.queue.get(job_id)
+        if job is None:
+            return None
+        with self.lock:
+            current = self.running.get(job_id, (None, None, None))[2]
+        return job_summary(job, current)
+
+    def report_path(self, job_id):
+        job = self.queue.get(job_id)
+        return job['artifacts'].get('report') if job else None
+
+    def list(self):
+        with self.lock:
+            current = {job_id: entry[2] for job_id, entry in self.running.items()}
+        return [job_summary(job, current.get(job['id'])) for job in self.queue.list()]
+
+    def cancel(self, job_id):
+        if self.queue.cancel(job_id) is None:
+            return None
+        with self.lock:
+            entry = self.running.get(job_id)
+        if entry:
+            entry[1].cancel("Cancelled through the report service")
+        return self.get(job_id)
+
+    def _worker(self, worker_id):
+        while not self.stopping.is_set():
+            job = self.queue.claim(worker_id)
+            if job is None:
+                self.new_job.wait(1)
+                self.new_job.clear()
+                continue
+            self._run(job, worker_id)
+
+    def _renew_leases(self):
+        # A lost lease or a cancel requested through the queue stops the job
+        while not self.stopping.wait(self.queue.lease / 3):
+            with self.lock:
+                running = list(self.running.items())
+            for job_id, (worker_id, cancel_token, _) in running:
+                if not self.queue.renew(job_id, worker_id):
+                    cancel_token.cancel("Cancelled or lease lost")
+
+    def _run(self, job, worker_id):
+        from pipeline import run_pipeline
+        job_id = job['id']
+        with self.lock:
+            api_key = self.keys.get(job_id) or self.api_key
+        if not api_key:
+            self.queue.fail(job_id, worker_id, "No Gemini key: submit the job again or start the service with --key")
+            return
+        cancel_token = CancelToken()
+        with self.lock:
+            self.running[job_id] = (worker_id, cancel_token, None)
+        stage_started = {}
+
+        def on_stage(stage, **artifacts):
+            now = time.time()
+            with self.lock:
+                previous = self.running[job_id][2]
+                self.running[job_id] = (worker_id, cancel_token, stage)
+            if previous:
+                self.queue.record_stage(job_id, STAGE_DONE[previous], now - stage_started[previous], **artifacts)
+            stage_started[stage] = now
+
+        # Prompt results of an interrupted attempt only need rendering
+        results_path = job['artifacts'].get('results') if job['stage'] == 'prompted' else None
+        try:
+            outcome = run_pipeline(dict(job['payload'], **{"Gemini Key": api_key}), cancel_token, on_stage, results_path,
+                                   run_id=job_id[:8])
+            if outcome['report']:
+                self.queue.record_stage(job_id, 'rendered', time.time() - stage_started['render'],
+                                        report=outcome['report'])
+                self.queue.complete(job_id, worker_id)
+            else:
+                self.queue.fail(job_id, worker_id, "The report could not be written")
+        except JobCancelled:
+            if not self.stopping.is_set():  # On shutdown the job stays queued for the next start
+                self.queue.mark_cancelled(job_id, worker_id)
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self.queue.fail(job_id, worker_id, str(e), retry=True)
+        finally:
+            with self.lock:
+                del self.running[job_id]
+                if self.queue.get(job_id)['status'] != 'queued':  # Kept for a retry
+                    self.keys.pop(job_id, None)
+
+    def shutdown(self):
+        self.stopping.set()
+        with self.lock:
+            running = list(self.running.values())
+        for _, cancel_token, _ in running:
+            cancel_token.cancel("Report service stopped")
+        for thread in self.threads:
+            thread.join()
+        self.queue.requeue_interrupted(self.worker_prefix)
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    manager = None  # Set by serve()
+
+    def _send_json(self, status, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _from_browser(self):
+        """Browsers send an Origin header with cross-origin (and all POST/DELETE) requests; clients don't."""
+        if self.headers.get('Origin') is None:
+            return False
+        self._send_json(403, {'error': "Requests from web pages are not accepted"})
+        return True
+
+    def _route(self):
+        """Splits the path into (job id or None, result requested)."""
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        if not parts or parts[0] != 'jobs' or len(parts) > 3 or (len(parts) == 3 and parts[2] != 'result'):
+            return False, None, False
+        return True, parts[1] if len(parts) > 1 else None, len(parts) == 3
+
+    def do_POST(self):
+        if self._from_browser():
+            return
+        valid, job_id, _ = self._route()
+        if not valid or job_id:
+            return self._send_json(404, {'error': "Not found"})
+        if self.headers.get_content_type() != 'application/json':
+            return self._send_json(415, {'error': "Jobs must be posted as application/json"})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            GUI_data = json.loads(self.rfile.read(length) or b'null')
+        except (ValueError, json.JSONDecodeError):
+            return self._send_json(400, {'error': "Invalid JSON"})
+        error = validate_job(GUI_data, key_required=not self.manager.api_key)
+        if error:
+            return self._send_json(400, {'error': error})
+        try:
+            priority = int(parse_qs(urlparse(self.path).query).get('priority', ['0'])[0])
+        except ValueError:
+            return self._send_json(400, {'error': "priority must be an integer"})
+        self._send_json(202, self.manager.submit(GUI_data, priority))
+
+    def do_GET(self):
+        if self._from_browser():
+            return
+        valid, job_id, result = self._route()
+        if not valid:
+            return self._send_json(404, {'error': "Not found"})
+        if job_id is None:
+            return self._send_json(200, self.manager.list())
+        job = self.manager.get(job_id)
+        if job is None:
+            return self._send_json(404, {'error': "Unknown job"})
+        if not result:
+            return self._send_json(200, job)
+        if job['status'] != 'done':
+            return self._send_json(409, {'error': f"Job is {job['status']}"})
+        report_path = self.manager.report_path(job_id)
+        try:
+            with open(report_path, 'rb') as f:
+                body = f.read()
+        except OSError as e:
+            return self._send_json(410, {'error': f"Report no longer available: {e}"})
+        self.send_response(200)
+        self.send_header('Content-Type', DOCX_TYPE)
+        self.send_header('Content-Disposition', f'attachment; filename="{job["report"]}"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_DELETE(self):
+        if self._from_browser():
+            return
+        valid, job_id, result = self._route()
+        if not valid or job_id is None or result:
+            return self._send_json(404, {'error': "Not found"})
+        job = self.manager.cancel(job_id)
+        if job is None:
+            return self._send_json(404, {'error': "Unknown job"})
+        self._send_json(202, job)
+
+    def log_message(self, format, *args):
+        print(f"[service] {self.address_string()} {format % args}")
+
+def create_server(host=default_host, port=default_port, workers=None, queue=None, api_key=None):
+    """Returns (server, manager); call server.serve_forever() to handle requests."""
+    manager = JobManager(workers, queue, api_key)
+    handler = type('Handler', (ReportRequestHandler,), {'manager': manager})
+    return ThreadingHTTPServer((host, port), handler), manager
+
+def serve(host=default_host, port=default_port, workers=None, warm=True, queue_file=None, api_key=None):
+    if warm:
+        from warmup import warm_up
+        warm_up()  # Load modules, resource texts and templates before the first job arrives
+    server, manager = create_server(host, port, workers, JobQueue(queue_file), api_key)
+    print(f"Report service listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        manager.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='report_service', description="Local report job service.")
+    parser.add_argument('--host', default=default_host)
+    parser.add_argument('--port', type=int, default=default_port)
+    parser.add_argument('--workers', type=int, default=default_workers, help="Jobs processed at the same time")
+    parser.add_argument('--queue', default=None, help="SQLite job queue file (default: jobs.db)")
+    parser.add_argument('--key', default=os.environ.get('GEMINI_API_KEY'),
+                        help="Gemini key for jobs submitted without one or resumed after a restart")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers, queue_file=args.queue, api_key=args.key)
+
+if __name__ == '__main__':
+    main()
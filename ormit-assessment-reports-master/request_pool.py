@@ -0,0 +1,63 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+class RequestPool:
+    """
+    Thread pool for model requests with the submit/shutdown interface of ThreadPoolExecutor.
+    Its threads are daemon threads, so closing the application does not wait for requests
+    still in flight (ThreadPoolExecutor joins its threads at exit, up to a request timeout).
+    Threads are started as work arrives, up to max_workers.
+    """
+
+    def __init__(self, max_workers, thread_name_prefix='request'):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._work = queue.SimpleQueue()
+        self._threads = []
+        self._idle = threading.Semaphore(0)
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new requests after shutdown")
+            self._work.put((future, fn, args, kwargs))
+            if not self._idle.acquire(blocking=False) and len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._worker, daemon=True,
+                                          name=f"{self.thread_name_prefix}_{len(self._threads)}")
+                self._threads.append(thread)
+                thread.start()
+        return future
+
+    def _worker(self):
+        while True:
+            item = self._work.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            self._idle.release()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while True:
+                    try:
+                        item = self._work.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        item[0].cancel()
+            for _ in self._threads:
+                self._work.put(None)  # Each thread stops after its current request
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from context_cache import context_hash
+
+cache_dir = 'cache'
+max_cache_bytes = 50 * 1024 * 1024  # Size cap for all cached responses together
+cache_ttl_seconds = 30 * 24 * 60 * 60  # Entries older than this are ignored and removed
+evict_to_fraction = 0.8  # Eviction makes room down to this fraction of the cap, so it runs rarely
+
+def response_key(model_name, prompt_key, prompt_text, context, **settings):
+    """Content address of a response: model, prompt key and text, context hash and any generation settings."""
+    parts = [model_name, prompt_key, prompt_text, context_hash(context), settings]
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    On-disk cache of post-processed model outputs, one JSON file per entry.
+    Reading an entry refreshes its modification time, so eviction removes the
+    least recently used entries first once the directory exceeds max_bytes. The size of
+    the directory is counted once when the cache is opened and kept up to date by put(),
+    so writes only scan the directory when eviction is due.
+    """
+
+    def __init__(self, directory=None, max_bytes=None, ttl=None, enabled=True):
+        self.directory = directory or cache_dir
+        self.max_bytes = max_bytes or max_cache_bytes
+        self.ttl = ttl or cache_ttl_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._size = 0  # Bytes in the directory, as far as this instance knows
+        if enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            with self._lock:
+                self._evict()  # Counts the size and removes expired entries
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """Returns the cached value, or None when missing, expired or bypassed."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                return None
+            if time.time() - entry.get('created', 0) > self.ttl:
+                self._size -= self._file_size(path)
+                self._remove(path)
+                return None
+            os.utime(path)  # Mark as recently used
+        return entry.get('value')
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'created': time.time(), 'value': value}, f)
+                replaced = self._file_size(path)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Error writing response cache entry {key}: {e}")
+                self._remove(tmp_path)
+                return
+            self._size += self._file_size(path) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.json'):
+                    self._remove(entry.path)
+            self._size = 0
+
+    def _evict(self):
+        """
+        Removes expired entries and, once over the size cap, least recently used ones until
+        under evict_to_fraction of the cap. Recounts the size.
+        """
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime > self.ttl:
+                self._remove(entry.path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * evict_to_fraction if total > self.max_bytes else total
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            self._remove(path)
+            total -= size
+        self._size = total
+
+    @staticmethod
+    def _file_size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
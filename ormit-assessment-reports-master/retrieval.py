@@ -0,0 +1,84 @@
+import re
+import numpy as np
+from token_budget import estimate_tokens
+
+chunk_words = 150  # Target chunk size; chunks are cut on line boundaries
+k1 = 1.5
+b = 0.75
+
+_TOKEN_REG = re.compile(r'\w+', re.UNICODE)
+
+# Frequent English and Dutch words, which say nothing about a chunk's topic
+STOPWORDS = set('''
+a an and are as at be been but by can do does for from had has have he her him his how i if in into is it its
+me more most my no not of on or our she so than that the their them then there these they this to too us was
+we were what when which who will with you your
+aan al als bij dan dat de den der deze die dit doen door een en er geen had heb heeft hem het hij hoe
+hun ik in is je ja kan kon maar me meer men met mij mijn na naar niet nog nu of om omdat ook op over te
+tot u uit van veel voor was wat we wel werd wie wij wordt zal ze zelf zich zij zijn zo zoals
+'''.split())
+
+def tokenize(text):
+    """Lower-cased word tokens, ignoring single characters and stopwords."""
+    return [token for token in _TOKEN_REG.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+def chunk_text(text, size=None):
+    """Splits extracted text into chunks of roughly `size` words without breaking lines."""
+    size = size or chunk_words
+    chunks, current, current_words = [], [], 0
+    for line in text.splitlines():
+        current.append(line)
+        current_words += len(line.split())
+        if current_words >= size:
+            chunks.append("\n".join(current))
+            current, current_words = [], 0
+    if any(line.strip() for line in current):
+        chunks.append("\n".join(current))
+    return chunks
+
+class BM25Index:
+    """
+    In-process BM25 index over the chunks of one document. The per-chunk term
+    weights are precomputed as a dense matrix, so scoring a query is one column sum.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        tokenized = [tokenize(chunk) for chunk in chunks]
+        self.vocabulary = {}
+        for tokens in tokenized:
+            for token in tokens:
+                self.vocabulary.setdefault(token, len(self.vocabulary))
+
+        tf = np.zeros((len(chunks), max(len(self.vocabulary), 1)), dtype=np.float32)
+        for row, tokens in enumerate(tokenized):
+            if tokens:
+                np.add.at(tf[row], [self.vocabulary[token] for token in tokens], 1)
+
+        n_chunks = len(chunks)
+        df = np.count_nonzero(tf, axis=0)
+        idf = np.log(1 + (n_chunks - df + 0.5) / (df + 0.5))
+        lengths = tf.sum(axis=1, keepdims=True)
+        norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1))
+        self.weights = idf * tf * (k1 + 1) / (tf + norm)
+
+    def scores(self, query):
+        columns = sorted({self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary})
+        if not columns:
+            return np.zeros(len(self.chunks), dtype=np.float32)
+        return self.weights[:, columns].sum(axis=1)
+
+    def select(self, query, token_budget):
+        """
+        Returns the highest scoring chunks that fit in token_budget,
+        joined in their original document order.
+        """
+        order = np.argsort(-self.scores(query), kind='stable')
+        selected, used = [], 0
+        for index in order:
+            tokens = estimate_tokens(self.chunks[index])
+            if used + tokens > token_budget:
+                continue
+            selected.append(index)
+            used += tokens
+        return "\n[...]\n".join(self.chunks[index] for index in sorted(selected))
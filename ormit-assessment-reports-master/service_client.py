@@ -0,0 +1,60 @@
+import json
+import os
+import urllib.error
+import urllib.request
+
+class ServiceError(Exception):
+    """The report service answered with an error or could not be reached."""
+
+class ServiceClient:
+    """Thin client of the local report service (see report_service.py), using only the standard library."""
+
+    def __init__(self, base_url, timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, method, path, payload=None, timeout=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = urllib.request.Request(f"{self.base_url}{path}", data=data, method=method,
+                                         headers={'Content-Type': 'application/json'} if data else {})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+                return response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error', e.reason)
+            except (ValueError, AttributeError):
+                message = e.reason
+            raise ServiceError(f"{method} {path} failed ({e.code}): {message}") from e
+        except (urllib.error.URLError, OSError) as e:
+            raise ServiceError(f"Report service unreachable: {e}") from e
+
+    def available(self):
+        """Quick check whether the service is running (used before every submit)."""
+        try:
+            self._request('GET', '/jobs', timeout=2)
+            return True
+        except ServiceError:
+            return False
+
+    def submit(self, GUI_data, priority=0):
+        """Submits a job and returns its id; jobs with a higher priority run first."""
+        body, _ = self._request('POST', f'/jobs?priority={int(priority)}', GUI_data)
+        return json.loads(body)['id']
+
+    def status(self, job_id):
+        body, _ = self._request('GET', f'/jobs/{job_id}')
+        return json.loads(body)
+
+    def cancel(self, job_id):
+        body, _ = self._request('DELETE', f'/jobs/{job_id}')
+        return json.loads(body)
+
+    def download(self, job_id, directory='.'):
+        """Saves the finished report in directory under its original name and returns the path."""
+        status = self.status(job_id)
+        body, _ = self._request('GET', f'/jobs/{job_id}/result')
+        path = os.path.join(directory, status['report'] or f"{job_id}.docx")
+        with open(path, 'wb') as f:
+            f.write(body)
+        return path
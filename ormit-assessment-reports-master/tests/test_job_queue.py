@@ -0,0 +1,85 @@
+"""
+Leases, restarts and attempts of the SQLite job queue. Run from the repository folder:
+
+    python -m pytest tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from job_queue import JobQueue  # noqa: E402
+
+class JobQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'jobs.db')
+        self.queue = JobQueue(self.path, lease=0.05)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def restart(self):
+        """Opens the queue again, as a new service process does, and requeues its jobs."""
+        self.queue.close()
+        self.queue = JobQueue(self.path, lease=0.05)
+        return self.queue.requeue_interrupted()
+
+    def test_expired_lease_is_claimed_again(self):
+        job_id = self.queue.enqueue({}, max_attempts=2)
+        self.assertEqual(self.queue.claim('worker-1')['id'], job_id)
+        self.assertIsNone(self.queue.claim('worker-2'))  # Lease still held
+        time.sleep(0.1)
+        job = self.queue.claim('worker-2')
+        self.assertEqual((job['id'], job['attempts']), (job_id, 2))
+        self.assertFalse(self.queue.renew(job_id, 'worker-1'))  # The first worker lost the job
+
+    def test_expired_lease_without_attempts_left_fails(self):
+        job_id = self.queue.enqueue({}, max_attempts=1)
+        self.queue.claim('worker-1')
+        time.sleep(0.1)
+        self.assertIsNone(self.queue.claim('worker-2'))
+        self.assertEqual(self.queue.get(job_id)['status'], 'failed')
+
+    def test_restart_requeues_running_jobs(self):
+        job_id = self.queue.enqueue({}, max_attempts=2)
+        self.queue.claim('worker-1')
+        self.assertEqual(self.restart(), 1)
+        self.assertEqual(self.queue.get(job_id)['status'], 'queued')
+        self.assertEqual(self.queue.claim('worker-2')['id'], job_id)  # Without waiting for the lease
+
+    def test_job_crashing_every_restart_runs_out_of_attempts(self):
+        job_id = self.queue.enqueue({}, max_attempts=2)
+        claims = 0
+        for _ in range(5):
+            if self.queue.claim('worker'):
+                claims += 1
+            self.restart()
+        self.assertEqual(claims, 2)
+        job = self.queue.get(job_id)
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('every attempt', job['error'])
+
+    def test_shutdown_gives_the_attempt_back(self):
+        job_id = self.queue.enqueue({}, max_attempts=1)
+        self.queue.claim('host:1:0')
+        self.assertEqual(self.queue.requeue_interrupted('host:1:'), 1)
+        job = self.queue.get(job_id)
+        self.assertEqual((job['status'], job['attempts']), ('queued', 0))
+
+    def test_restart_cancels_jobs_that_were_to_be_cancelled(self):
+        job_id = self.queue.enqueue({})
+        self.queue.claim('worker-1')
+        self.queue.cancel(job_id)
+        self.assertEqual(self.restart(), 0)
+        self.assertEqual(self.queue.get(job_id)['status'], 'cancelled')
+
+if __name__ == '__main__':
+    unittest.main()
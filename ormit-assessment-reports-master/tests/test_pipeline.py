@@ -0,0 +1,105 @@
+"""
+Smoke test of the whole pipeline (redact, prompt, render) on the sample files in temp/,
+with the in-process fake model backend. Run from the repository folder:
+
+    python -m pytest tests
+"""
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+SAMPLES = os.path.join(REPO, 'temp')
+
+def sample_job(traineeship='MCP'):
+    return {
+        "Gemini Key": "test-key",
+        "Applicant Name": "Marc van Kampen",
+        "Assessor Name": "An Smet",
+        "Gender": "M",
+        "Traineeship": traineeship,
+        "Files": {
+            "PAPI Gebruikersrapport": os.path.join(SAMPLES, "PAPI Feedback.pdf"),
+            "Cog. Test": os.path.join(SAMPLES, "Cog. Test.pdf"),
+            "Assessment Notes": os.path.join(SAMPLES, "Assessment Notes.pdf"),
+        },
+    }
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        import prompting
+        import workspace
+        self.cwd = os.getcwd()
+        os.chdir(REPO)  # Resources and templates are found relative to the repository
+        self.output = tempfile.mkdtemp()
+        self.settings = {name: getattr(prompting, name) for name in
+                         ['llm_backend', 'use_response_cache', 'context_cache_backend', 'resume_runs']}
+        prompting.llm_backend = 'fake'
+        prompting.use_response_cache = False
+        prompting.context_cache_backend = 'local'
+        prompting.resume_runs = False
+        self.workspace_root = workspace.workspace_root
+        workspace.workspace_root = os.path.join(self.output, 'workspaces')
+
+    def tearDown(self):
+        import prompting
+        import workspace
+        for name, value in self.settings.items():
+            setattr(prompting, name, value)
+        workspace.workspace_root = self.workspace_root
+        os.chdir(self.cwd)
+        shutil.rmtree(self.output, ignore_errors=True)
+
+    def run_job(self, traineeship):
+        from pipeline import run_pipeline
+        stages = []
+        outcome = run_pipeline(sample_job(traineeship), on_stage=lambda stage, **artifacts: stages.append(stage),
+                               output_folder=self.output)
+        self.assertEqual(stages, ['redact', 'extract', 'prompt', 'render'])
+        self.assertTrue(outcome['report'] and os.path.exists(outcome['report']))
+        self.assertEqual(os.path.dirname(os.path.abspath(outcome['report'])), self.output)
+        with open(outcome['results'], 'r') as f:
+            results = json.load(f)
+        self.assertTrue(results['_run']['complete'], results['_run'].get('failed_prompts'))
+        self.assertEqual(os.listdir(os.path.join(self.output, 'workspaces')), [])  # Workspace removed
+        return results
+
+    def test_mcp_report(self):
+        results = self.run_job('MCP')
+        self.assertEqual(len(json.loads(results['prompt7_qualscore'])), 20)
+
+    def test_data_report(self):
+        results = self.run_job('DATA')
+        self.assertIn('prompt8_datatools', results)
+
+    def test_rerender_from_results(self):
+        from pipeline import run_pipeline
+        first = run_pipeline(sample_job(), output_folder=self.output)
+        stages = []
+        second = run_pipeline(sample_job(), on_stage=lambda stage, **artifacts: stages.append(stage),
+                              results_path=first['results'], output_folder=self.output)
+        self.assertEqual(stages, ['render'])
+        # Runs in the same minute don't overwrite each other's report
+        self.assertNotEqual(first['report'], second['report'])
+        self.assertTrue(os.path.exists(first['report']) and os.path.exists(second['report']))
+
+class GeminiClientTest(unittest.TestCase):
+
+    def test_backends_keep_their_own_key(self):
+        try:
+            import google.generativeai  # noqa: F401
+        except ImportError:
+            self.skipTest("google-generativeai is not installed")
+        from llm_backends import GeminiBackend
+        first, second = GeminiBackend('key-one'), GeminiBackend('key-two')
+        self.assertEqual(first.model._client._transport._credentials.token, 'key-one')
+        self.assertEqual(second.model._client._transport._credentials.token, 'key-two')
+
+if __name__ == '__main__':
+    unittest.main()
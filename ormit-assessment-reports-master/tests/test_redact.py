@@ -0,0 +1,70 @@
+"""
+Redaction with the page word index (redact.redaction_areas) against the line-by-line
+redactor it replaced: Redactor.get_sensitive_data and one page.search_for per hit.
+Run from the repository folder:
+
+    python -m pytest tests
+"""
+import os
+import sys
+import unittest
+from collections import Counter
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+SAMPLES = os.path.join(REPO, 'temp')
+TARGET_NAMES = ["Marc", "Kampen"]  # As redact_folder splits "Marc van Kampen"
+
+import fitz  # noqa: E402
+from redact import Redactor, SensitiveDataMatcher, redaction_areas  # noqa: E402
+
+def redact_baseline(page):
+    text = page.get_text("text")
+    for hit in Redactor.get_sensitive_data(text.split('\n'), TARGET_NAMES):
+        for area in page.search_for(hit):
+            page.add_redact_annot(area, fill=(0, 0, 0))
+    page.apply_redactions()
+
+def redact_indexed(page, matcher):
+    textpage = page.get_textpage()
+    text = page.get_text("text", textpage=textpage)
+    for areas in redaction_areas(page, text, matcher.find(text), textpage).values():
+        for area in areas:
+            page.add_redact_annot(area, fill=(0, 0, 0))
+    page.apply_redactions()
+
+def remaining_words(path, redact_page):
+    with fitz.open(path) as doc:
+        for page in doc:
+            redact_page(page)
+        return Counter(word[4] for page in doc for word in page.get_text("words"))
+
+class RedactionTest(unittest.TestCase):
+
+    def test_samples_match_baseline(self):
+        matcher = SensitiveDataMatcher(TARGET_NAMES)
+        for name in ["PAPI Feedback.pdf", "Cog. Test.pdf", "Assessment Notes.pdf"]:
+            with self.subTest(name):
+                path = os.path.join(SAMPLES, name)
+                baseline = remaining_words(path, redact_baseline)
+                indexed = remaining_words(path, lambda page: redact_indexed(page, matcher))
+                # Only whole words are redacted now: page.search_for also blanked the name inside
+                # a longer word ("démarche"), leaving its pieces ("dé", "he") behind
+                kept = indexed - baseline
+                for word in kept:
+                    self.assertTrue(any(target.lower() in word.lower() for target in TARGET_NAMES), word)
+                    self.assertEqual(matcher.find(word), [], word)
+                for piece in baseline - indexed:
+                    self.assertTrue(any(piece in word for word in kept), piece)
+
+    def test_miss_not_hidden_by_match_across_lines(self):
+        # The index finds the number across the line break, which the page text does not
+        # count; the glued "tel:+32 ..." is not in the index but must still be redacted
+        with fitz.open() as doc:
+            page = doc.new_page()
+            page.insert_text((72, 72), "Call +32 496\n61 73 89 today\nor tel:+32 496 61 73 89 later")
+            redact_indexed(page, SensitiveDataMatcher(TARGET_NAMES))
+            self.assertNotIn("496 61 73 89", page.get_text("text"))
+
+if __name__ == '__main__':
+    unittest.main()
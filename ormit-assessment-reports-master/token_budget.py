@@ -0,0 +1,72 @@
+import re
+from collections import Counter
+
+context_token_budget = 30000  # Default per prompt, instructions included
+prompt_token_budgets = {}  # Per-prompt overrides, e.g. {'prompt8_datatools': 8000}
+auto_trim_context = True  # Trim over-budget contexts instead of only warning
+count_tokens_with_model = False  # Ask the model for exact counts (one extra request per text)
+
+min_repeats = 3  # A line seen this often is treated as a header, footer or legend
+min_repeated_line_length = 20  # Shorter lines such as 'Strong yes' are real content
+
+boilerplate_patterns = [
+    r'all rights reserved',
+    r'alle rechten voorbehouden',
+    r'^file generated on',
+    r'^powered by$',
+    r'de informatie in dit rapport is vertrouwelijk',
+    r'^page \d+( of \d+)?$',
+    r'^pagina \d+( van \d+)?$',
+]
+_BOILERPLATE_REG = re.compile('|'.join(boilerplate_patterns), re.IGNORECASE)
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English/Dutch text)."""
+    return len(text) // 4
+
+def count_tokens(text, backend=None):
+    """Exact count from the model backend when enabled, otherwise the local estimate."""
+    if count_tokens_with_model and backend is not None:
+        try:
+            return backend.count_tokens(text)
+        except Exception as e:
+            print(f"Token counting failed, using estimate: {e}")
+    return estimate_tokens(text)
+
+def budget_for(prompt_key):
+    return prompt_token_budgets.get(prompt_key, context_token_budget)
+
+def _collapse_whitespace(text):
+    lines = [re.sub(r'[ \t]+', ' ', line).strip() for line in text.splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', "\n".join(lines))
+
+def _drop_boilerplate(text):
+    return "\n".join(line for line in text.splitlines() if not _BOILERPLATE_REG.search(line.strip()))
+
+def _drop_repeated_lines(text):
+    """Keeps the first occurrence of lines that repeat on many pages (headers, PAPI legend text)."""
+    lines = text.splitlines()
+    counts = Counter(line.strip() for line in lines)
+    seen = set()
+    kept = []
+    for line in lines:
+        key = line.strip()
+        if counts[key] >= min_repeats and len(key) >= min_repeated_line_length:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(line)
+    return "\n".join(kept)
+
+TRIM_STEPS = [_collapse_whitespace, _drop_boilerplate, _drop_repeated_lines]
+
+def trim_texts(texts, token_budget, fixed_tokens=0):
+    """
+    Applies the trim steps to every document in order, stopping as soon as the documents
+    plus fixed_tokens (the instructions) fit the budget. Returns the trimmed texts.
+    """
+    for step in TRIM_STEPS:
+        if sum(estimate_tokens(text) for text in texts.values()) + fixed_tokens <= token_budget:
+            break
+        texts = {name: step(text) for name, text in texts.items()}
+    return texts
@@ -0,0 +1,98 @@
+import importlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# In the system temp folder like the job workspaces, not in the working directory (the checkout)
+startup_report_path = os.path.join(tempfile.gettempdir(), 'assessment_reports_startup.json')
+
+# Imported in the background after the window is shown, heaviest dependencies first
+warm_modules = ['google.generativeai', 'fitz', 'numpy', 'PyPDF2', 'docx',
+                'redact', 'prompting', 'write_report_mcp', 'write_report_data', 'pipeline']
+
+class StartupReport:
+    """
+    Start-up timings in seconds, saved as JSON: module imports (like -X importtime,
+    cumulative per module, with the number of modules each one pulled in), resource
+    parsing and backend set-up.
+    """
+
+    def __init__(self):
+        self.sections = {'startup': {}, 'imports': {}, 'resources': {}, 'backend': {}}
+        self._lock = threading.Lock()
+
+    def record(self, section, name, value):
+        with self._lock:
+            self.sections[section][name] = value
+
+    def save(self, path=None):
+        with self._lock:
+            content = json.dumps(self.sections, indent=2)
+        try:
+            with open(path or startup_report_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+        except OSError as e:
+            print(f"Could not write start-up report: {e}")
+
+startup_report = StartupReport()
+
+def timed_import(name):
+    """Imports a module and records how long it took; modules that were already loaded cost nothing."""
+    loaded_before = len(sys.modules)
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    startup_report.record('imports', name, {'seconds': round(time.perf_counter() - start, 3),
+                                            'new_modules': len(sys.modules) - loaded_before})
+    return module
+
+def _timed(section, name, fn, *args):
+    start = time.perf_counter()
+    try:
+        fn(*args)
+    except Exception as e:
+        print(f"Warm-up step {name} failed: {e}")
+        return
+    startup_report.record(section, name, round(time.perf_counter() - start, 3))
+
+def configure_backend(api_key):
+    """Creates the default model backend (and its client) for this key, so the first run can reuse it."""
+    prompting = timed_import('prompting')
+    _timed('backend', f"{prompting.llm_backend}:{prompting.model_name}", prompting.get_backend,
+           prompting.llm_backend, api_key, prompting.model_name, prompting.openai_base_url)
+
+def warm_up(api_key=None):
+    """Imports the pipeline, parses the resource documents and templates, and sets up the backend."""
+    start = time.perf_counter()
+    for name in warm_modules:
+        try:
+            timed_import(name)
+        except ImportError as e:
+            print(f"Warm-up could not import {name}: {e}")
+
+    prompting = sys.modules.get('prompting')
+    if prompting is not None:
+        _timed('resources', 'resource documents', prompting.preload_resources)
+    for name in ['write_report_mcp', 'write_report_data']:
+        write_report = sys.modules.get(name)
+        if write_report is not None:
+            _timed('resources', write_report.TEMPLATE_PATH, write_report.load_template, write_report.TEMPLATE_PATH)
+
+    if api_key:
+        configure_backend(api_key)
+    startup_report.record('startup', 'warm_up_seconds', round(time.perf_counter() - start, 3))
+    startup_report.save()
+
+def start_warm_up(api_key=None):
+    """Runs warm_up() in a daemon thread and returns the thread."""
+    thread = threading.Thread(target=warm_up, args=(api_key,), name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+def start_backend_configuration(api_key):
+    """Configures the backend in the background once the key is known (e.g. after it was typed)."""
+    thread = threading.Thread(target=configure_backend, args=(api_key,), name='backend-setup', daemon=True)
+    thread.start()
+    return thread
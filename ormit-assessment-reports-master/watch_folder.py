@@ -0,0 +1,226 @@
+"""
+Watch-folder mode: drafts a report for every candidate folder dropped into an inbox.
+
+    python -m watch_folder inbox outbox --workers 2
+
+A candidate folder holds the three PDFs and a candidate.json with the fields
+name, assessor, gender and traineeship (and optionally priority). The PDFs are found by
+name (PAPI / Cog / Notes) unless candidate.json names them under papi, cogtest and notes.
+
+A folder is picked up once its files stop changing for settle_seconds, so half-copied
+folders are left alone. Folders with the same contents as a queued, running or finished
+job are not run again (the content hash is the job's key in the queue); after a failed or
+cancelled job, the same contents can be dropped in again for a new job. Jobs run from the persistent
+queue (job_queue.py) on a fixed number of workers; each report is moved to
+outbox/<folder>/ and the candidate folder to inbox/processed/ (or inbox/failed/).
+
+The Gemini key is read from --key or the GEMINI_API_KEY environment variable; it is not
+stored in the queue.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+poll_seconds = 2
+settle_seconds = 5  # A folder must be unchanged this long before it is picked up
+
+METADATA_FILE = 'candidate.json'
+PROCESSED_FOLDER = 'processed'
+FAILED_FOLDER = 'failed'
+
+# Manifest field -> words that identify the PDF by file name
+PDF_NAMES = {
+    'papi': ['papi'],
+    'cogtest': ['cog'],
+    'notes': ['notes', 'notities'],
+}
+
+def folder_snapshot(folder):
+    """(name, size, mtime) of every file in folder; a copy in progress changes it."""
+    snapshot = []
+    for entry in sorted(os.scandir(folder), key=lambda entry: entry.name):
+        if entry.is_file():
+            stat = entry.stat()
+            snapshot.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(snapshot)
+
+def find_bundle_files(folder, metadata):
+    """Returns {'papi': path, 'cogtest': path, 'notes': path}; raises ValueError when one is missing."""
+    pdfs = [name for name in os.listdir(folder) if name.lower().endswith('.pdf')]
+    files = {}
+    for field, words in PDF_NAMES.items():
+        if metadata.get(field):
+            name = metadata[field]
+        else:
+            matches = [pdf for pdf in pdfs if any(word in pdf.lower() for word in words)]
+            if len(matches) != 1:
+                raise ValueError(f"expected one {field} PDF, found {len(matches)}")
+            name = matches[0]
+        path = os.path.join(folder, name)
+        if not os.path.isfile(path):
+            raise ValueError(f"{name} not found")
+        files[field] = path
+    return files
+
+def bundle_hash(metadata_path, files):
+    """SHA-256 over the metadata and the three PDFs."""
+    digest = hashlib.sha256()
+    for path in [metadata_path] + [files[field] for field in PDF_NAMES]:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def move_into(path, folder):
+    """Moves path into folder, adding a suffix if the name is taken; returns the new path."""
+    os.makedirs(folder, exist_ok=True)
+    name = os.path.basename(path)
+    target = os.path.join(folder, name)
+    counter = 1
+    while os.path.exists(target):
+        base, extension = os.path.splitext(name)
+        target = os.path.join(folder, f"{base} ({counter}){extension}")
+        counter += 1
+    shutil.move(path, target)
+    return target
+
+class FolderWatcher:
+    """Polls the inbox, enqueues settled candidate folders and delivers finished reports."""
+
+    def __init__(self, inbox, outbox, queue, api_key, settle=None):
+        self.inbox = os.path.abspath(inbox)
+        self.outbox = os.path.abspath(outbox)
+        self.queue = queue
+        self.api_key = api_key
+        self.settle = settle if settle is not None else settle_seconds
+        self.seen = {}  # Folder -> (snapshot, time it last changed)
+        self.tracked = {}  # Folder -> job id
+        self.rejected = {}  # Folder -> snapshot that could not be used, to report it once
+
+    def candidate_folders(self):
+        skip = {PROCESSED_FOLDER, FAILED_FOLDER}
+        return [entry.path for entry in os.scandir(self.inbox)
+                if entry.is_dir() and entry.name not in skip and not entry.name.startswith('.')]
+
+    def settled(self, folder):
+        """True once the folder has not changed for self.settle seconds."""
+        snapshot = folder_snapshot(folder)
+        now = time.time()
+        previous = self.seen.get(folder)
+        if previous is None or previous[0] != snapshot:
+            self.seen[folder] = (snapshot, now)
+            return False
+        newest = max((mtime for _, _, mtime in snapshot), default=0) / 1e9
+        return now - max(previous[1], newest) >= self.settle
+
+    def scan(self):
+        """Enqueues every settled, complete candidate folder that is not tracked yet."""
+        for folder in self.candidate_folders():
+            if folder in self.tracked or not self.settled(folder):
+                continue
+            snapshot = self.seen[folder][0]
+            if self.rejected.get(folder) == snapshot:
+                continue
+            try:
+                self.enqueue(folder)
+            except (OSError, ValueError) as e:
+                # Left in the inbox: the folder is retried as soon as its contents change
+                print(f"Skipping {os.path.basename(folder)}: {e}")
+                self.rejected[folder] = snapshot
+
+    def enqueue(self, folder):
+        from report_cli import candidate_data
+        metadata_path = os.path.join(folder, METADATA_FILE)
+        if not os.path.isfile(metadata_path):
+            raise ValueError(f"no {METADATA_FILE}")
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            metadata = {key.lower(): value for key, value in json.load(f).items()}
+        files = find_bundle_files(folder, metadata)
+        GUI_data = candidate_data(dict(metadata, **files), self.api_key)
+        key = bundle_hash(metadata_path, files)
+        job_id, created = self.queue.enqueue_once(GUI_data, key, int(metadata.get('priority', 0)))
+        job = self.queue.get(job_id)
+        if created or os.path.dirname(job['payload']["Files"]["Assessment Notes"]) == folder:
+            # New, or queued from this folder before a restart
+            print(f"Queued {GUI_data['Applicant Name']} ({os.path.basename(folder)}) as job {job_id}")
+            self.tracked[folder] = job_id
+        else:
+            print(f"{os.path.basename(folder)} duplicates job {job_id}, not run again")
+            move_into(folder, os.path.join(self.inbox, PROCESSED_FOLDER))
+
+    def deliver(self):
+        """Moves reports of finished jobs to the outbox and their folders out of the inbox."""
+        for folder, job_id in list(self.tracked.items()):
+            job = self.queue.get(job_id)
+            if job['status'] in ('queued', 'running'):
+                continue
+            name = os.path.basename(folder)
+            report = job['artifacts'].get('report')
+            if job['status'] == 'done' and report and os.path.exists(report):
+                target = move_into(report, os.path.join(self.outbox, name))
+                move_into(folder, os.path.join(self.inbox, PROCESSED_FOLDER))
+                print(f"Report for {name} written to {target}")
+            else:
+                error = job['error'] or f"Job {job['status']}"
+                moved = move_into(folder, os.path.join(self.inbox, FAILED_FOLDER))
+                with open(os.path.join(moved, 'error.txt'), 'w', encoding='utf-8') as f:
+                    f.write(f"Job {job_id}: {error}\n")
+                print(f"No report for {name}: {error}")
+            del self.tracked[folder]
+            self.seen.pop(folder, None)
+
+    def poll(self):
+        self.scan()
+        self.deliver()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='watch_folder', description="Draft a report for every candidate folder dropped into an inbox.")
+    parser.add_argument('inbox', help="Folder watched for candidate folders")
+    parser.add_argument('outbox', help="Folder the reports are written to")
+    parser.add_argument('--workers', type=int, default=2, help="Candidates processed at the same time")
+    parser.add_argument('--queue', default='watch_jobs.db', help="SQLite job queue file")
+    parser.add_argument('--poll', type=float, default=poll_seconds, help="Seconds between inbox scans")
+    parser.add_argument('--settle', type=float, default=settle_seconds, help="Seconds a folder must be unchanged")
+    parser.add_argument('--key', default=os.environ.get('GEMINI_API_KEY', ''), help="Gemini API key")
+    parser.add_argument('--once', action='store_true', help="Process the folders in the inbox now and exit")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isdir(args.inbox):
+        print(f"Inbox {args.inbox} does not exist")
+        return 2
+    if not args.key:
+        print("No Gemini key: pass --key or set GEMINI_API_KEY")
+        return 2
+    os.makedirs(args.outbox, exist_ok=True)
+
+    from job_queue import JobQueue
+    from report_service import JobManager
+    queue = JobQueue(args.queue)
+    manager = JobManager(args.workers, queue, args.key)  # Runs the queued jobs, at most --workers at a time
+    watcher = FolderWatcher(args.inbox, args.outbox, queue, args.key, 0 if args.once else args.settle)
+    print(f"Watching {watcher.inbox} with {args.workers} workers")
+    try:
+        if args.once:
+            watcher.scan()  # Registers the folders
+            watcher.scan()  # and enqueues them
+            while watcher.tracked:
+                time.sleep(args.poll)
+                watcher.deliver()
+        else:
+            while True:
+                watcher.poll()
+                time.sleep(args.poll)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.shutdown()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
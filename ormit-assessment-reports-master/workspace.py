@@ -0,0 +1,32 @@
+import os
+import shutil
+import tempfile
+
+workspace_root = None  # Folder for job workspaces; None uses the system temp folder
+keep_workspaces = False  # Keep the redacted files of every job, for debugging
+
+class Workspace:
+    """
+    Private folder for the intermediate files of one job (the redacted PDFs), so jobs can
+    run at the same time. Used as a context manager, the folder is removed afterwards.
+    """
+
+    def __init__(self, prefix='report-'):
+        if workspace_root:
+            os.makedirs(workspace_root, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=prefix, dir=workspace_root)
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def cleanup(self):
+        if keep_workspaces:
+            print(f"Workspace kept at {self.path}")
+            return
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
@@ -1,3 +1,4 @@
+import io
 import os
 import sys
 from datetime import datetime
@@ -9,6 +10,7 @@ import ast
 import json
 import re
 import logging
+from cancellation import check_cancelled
 
 # --- Configure Logging ---
 logging.basicConfig(
@@ -40,6 +42,17 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 # --- Helper Functions ---
+TEMPLATE_PATH = 'resources/Assessment_report_Data_chiefs.docx'
+_template_bytes = {}  # Template files are read from disk once per process
+
+def load_template(relative_path):
+    """Returns a fresh Document of the template, from bytes cached on first use."""
+    path = resource_path(relative_path)
+    if path not in _template_bytes:
+        with open(path, 'rb') as f:
+            _template_bytes[path] = f.read()
+    return Document(io.BytesIO(_template_bytes[path]))
+
 def _safe_get_table(doc, table_index, default=None):
     """Safely retrieves a table."""
     try: return doc.tables[table_index]
@@ -152,10 +165,11 @@ def clean_up(loc_dic):
         logging.error(f"Error loading/cleaning JSON: {e}")
         return {}
 
-def update_document(output_dic, name, assessor, gender, program):
+def update_document(output_dic, name, assessor, gender, program, cancel_token=None, output_folder='.', run_id=None):
     """Updates the Word document."""
+    check_cancelled(cancel_token)
     try:
-        doc = Document(resource_path('resources/Assessment_report_Data_chiefs.docx'))
+        doc = load_template(TEMPLATE_PATH)
     except Exception as e:
         logging.error(f"Failed to open template: {e}")
         return None
@@ -209,9 +223,11 @@ def update_document(output_dic, name, assessor, gender, program):
         logging.warning("Invalid data_tools_scores data.")
 
     # --- Save Document ---
+    check_cancelled(cancel_token)  # Don't write a report for a cancelled job
     current_time = datetime.now()
     formatted_time = current_time.strftime("%m%d%H%M")
-    updated_doc_path = f"Assessment Report - {name} - {formatted_time}.docx"
+    run_suffix = f" - {run_id}" if run_id else ""  # Keeps reports of simultaneous jobs apart
+    updated_doc_path = os.path.join(output_folder, f"Assessment Report - {name} - {formatted_time}{run_suffix}.docx")
     try:
         doc.save(updated_doc_path)
         return updated_doc_path
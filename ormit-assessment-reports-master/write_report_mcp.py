@@ -1,3 +1,4 @@
+import io
 import os
 import sys
 from datetime import datetime
@@ -9,6 +10,7 @@ import ast
 import json
 import re
 import logging
+from cancellation import check_cancelled
 
 logging.basicConfig(
     level=logging.INFO,
@@ -33,6 +35,17 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+TEMPLATE_PATH = 'resources/template.docx'
+_template_bytes = {}  # Template files are read from disk once per process
+
+def load_template(relative_path):
+    """Returns a fresh Document of the template, from bytes cached on first use."""
+    path = resource_path(relative_path)
+    if path not in _template_bytes:
+        with open(path, 'rb') as f:
+            _template_bytes[path] = f.read()
+    return Document(io.BytesIO(_template_bytes[path]))
+
 def _safe_get_table(doc, table_index, default=None):
     """Safely retrieves a table."""
     try:
@@ -132,10 +145,11 @@ def clean_up(loc_dic):
         logging.error(f"Error loading/cleaning JSON: {e}")
         return {}
 
-def update_document(output_dic, name, assessor, gender, program):
+def update_document(output_dic, name, assessor, gender, program, cancel_token=None, output_folder='.', run_id=None):
     """Updates the Word document (MCP version)."""
+    check_cancelled(cancel_token)
     try:
-        doc = Document(resource_path('resources/template.docx'))  # MCP Template
+        doc = load_template(TEMPLATE_PATH)  # MCP Template
     except Exception as e:
         logging.error(f"Failed to open template: {e}")
         return None
@@ -178,9 +192,11 @@ def update_document(output_dic, name, assessor, gender, program):
 
 
     # --- Save Document ---
+    check_cancelled(cancel_token)  # Don't write a report for a cancelled job
     current_time = datetime.now()
     formatted_time = current_time.strftime("%m%d%H%M")
-    updated_doc_path = f"Assessment Report - {name} - {formatted_time}.docx"
+    run_suffix = f" - {run_id}" if run_id else ""  # Keeps reports of simultaneous jobs apart
+    updated_doc_path = os.path.join(output_folder, f"Assessment Report - {name} - {formatted_time}{run_suffix}.docx")
     try:
         doc.save(updated_doc_path)
         return updated_doc_path